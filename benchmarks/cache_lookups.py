@@ -0,0 +1,150 @@
+"""Query plans and timings of the reads the chart endpoints issue, on a large seeded cache.
+
+Loads init.sql into a scratch schema and seeds youtube_cache and reddit_cache
+with millions of rows; the statement triggers fill the daily sentiment rollups
+as they would during ingestion. The charts only read the rollups
+(get_daily_sentiment), over 24 months for youtube and 30 days for reddit, so
+those reads are timed for one brand and for a multi brand request, next to the
+same aggregate computed from the raw cache rows for comparison.
+
+search_video_database and search_post_database are not on the chart path, so
+the cache only keeps the plain (query, datetime) index that ingestion needs.
+
+    DB_HOST=localhost DB_USER=postgres DB_NAME=data python benchmarks/cache_lookups.py --rows 2000000
+"""
+
+import argparse
+import os
+import pathlib
+import time
+
+import psycopg2
+
+INIT_SQL = pathlib.Path(__file__).resolve().parent.parent / "init.sql"
+
+# keep in sync with DAILY_SENTIMENT_SQL (yt-backend/src/db.py) and get_daily_sentiment (reddit-backend/db.py)
+ROLLUP_READ_SQL = """
+    SELECT query, day, bucket, sentiment_count, sentiment_sum, sentiment_sum_sq
+    FROM {rollup}
+    WHERE query = ANY(%s)
+    AND day >= current_date - {days}
+    AND day <= current_date
+    AND sentiment_count > 0
+"""
+
+# what the rollup saves: the same aggregates from the raw rows
+RAW_READ_SQL = """
+    SELECT query, datetime::date AS day, sentiment_bucket(avg_sentiment) AS bucket, count(*),
+        sum(avg_sentiment), sum(avg_sentiment * avg_sentiment)
+    FROM {table}
+    WHERE query = ANY(%s)
+    AND datetime >= current_date - {days}
+    AND avg_sentiment IS NOT NULL
+    GROUP BY 1, 2, 3
+"""
+
+# cache table: (rollup table, days of the widest chart window)
+CHART_READS = {
+    "youtube_cache": ("youtube_daily_sentiment", 730),
+    "reddit_cache": ("reddit_daily_sentiment", 30),
+}
+
+SEED_SQL = {
+    "youtube_cache": """
+        INSERT INTO youtube_cache (video_id, query, datetime, views, likes, comments, avg_comment_sentiment, title_sentiment)
+        SELECT 'v' || i, 'brand' || (i %% %(brands)s), now() - random() * interval '730 days',
+            (random() * 1e6)::int, (random() * 1e4)::int, (random() * 1e3)::int, random() * 2 - 1, random() * 2 - 1
+        FROM generate_series(1, %(rows)s) AS i
+    """,
+    "reddit_cache": """
+        INSERT INTO reddit_cache (post_id, query, subreddit, datetime, title_sentiment, avg_comment_sentiment)
+        SELECT 'p' || i, 'brand' || (i %% %(brands)s), 'sub' || (i %% 50), now() - random() * interval '730 days',
+            random() * 2 - 1, random() * 2 - 1
+        FROM generate_series(1, %(rows)s) AS i
+    """,
+}
+
+
+def connect():
+    return psycopg2.connect(
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        database=os.getenv("DB_NAME"),
+    )
+
+
+def setup(conn, schema: str, rows: int, brands: int):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        cur.execute(f"CREATE SCHEMA {schema}")
+        cur.execute(f"SET search_path TO {schema}")
+        cur.execute(INIT_SQL.read_text())
+        for table, sql in SEED_SQL.items():
+            started = time.perf_counter()
+            cur.execute(sql, {"rows": rows, "brands": brands})
+            print(f"Seeded {rows} rows into {table} in {time.perf_counter() - started:.1f}s")
+    conn.commit()
+
+    # index-only scans need the visibility map, autovacuum sets it for insert-only tables in production
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        for table, (rollup, _) in CHART_READS.items():
+            cur.execute(f"VACUUM ANALYZE {table}")
+            cur.execute(f"VACUUM ANALYZE {rollup}")
+    conn.autocommit = False
+
+
+def explain(cur, sql: str, brands: list[str]) -> str:
+    cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql, (brands,))
+    return "\n".join(row[0] for row in cur.fetchall())
+
+
+def timed(cur, sql: str, brand_sets: list[list[str]], repeats: int) -> float:
+    started = time.perf_counter()
+    for i in range(repeats):
+        cur.execute(sql, (brand_sets[i % len(brand_sets)],))
+        cur.fetchall()
+    return (time.perf_counter() - started) / repeats * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000, help="rows seeded into each table")
+    parser.add_argument("--brands", type=int, default=200, help="distinct queries in the seeded rows")
+    parser.add_argument("--request-brands", type=int, default=5, help="brands of a multi brand chart request")
+    parser.add_argument("--repeats", type=int, default=200, help="reads timed per query")
+    parser.add_argument("--schema", default="cache_benchmark")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded schema afterwards")
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        setup(conn, args.schema, args.rows, args.brands)
+        with conn.cursor() as cur:
+            cur.execute(f"SET search_path TO {args.schema}")
+            for table, (rollup, days) in CHART_READS.items():
+                for per_request in (1, args.request_brands):
+                    brand_sets = [
+                        [f"brand{(i + j) % args.brands}" for j in range(per_request)]
+                        for i in range(0, args.brands, per_request)
+                    ]
+                    for label, sql in (
+                        (rollup, ROLLUP_READ_SQL.format(rollup=rollup, days=days)),
+                        (f"{table} aggregated", RAW_READ_SQL.format(table=table, days=days)),
+                    ):
+                        print(f"\n== {label}, {per_request} brand(s), {days} days ==")
+                        print(explain(cur, sql, brand_sets[0]))
+                        print(f"mean over {args.repeats} reads: {timed(cur, sql, brand_sets, args.repeats):.2f} ms")
+    finally:
+        if not args.keep:
+            conn.rollback()
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
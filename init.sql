@@ -1,39 +1,254 @@
+-- the cache tables are partitioned by month of datetime. This creates the
+-- partitions from the retention cutoff (or backfill_months back when retention
+-- is off) up to months_ahead months from now, and drops the partitions and
+-- rollup days older than retention_months. Rows outside the created months
+-- land in the default partition.
+CREATE OR REPLACE FUNCTION maintain_cache_partitions(
+	parent TEXT,
+	rollup TEXT,
+	retention_months INTEGER,
+	months_ahead INTEGER DEFAULT 3,
+	backfill_months INTEGER DEFAULT 24
+) RETURNS VOID AS $$
+DECLARE
+	this_month DATE := date_trunc('month', now())::date;
+	cutoff DATE := this_month - make_interval(months => CASE WHEN retention_months > 0 THEN retention_months ELSE backfill_months END);
+	month DATE;
+	part RECORD;
+BEGIN
+	IF retention_months > 0 THEN
+		FOR part IN
+			SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+			WHERE i.inhparent = parent::regclass
+			AND c.relname ~ '_y\d{4}m\d{2}$'
+			AND to_date(substring(c.relname from '(\d{4}m\d{2})$'), 'YYYY"m"MM') < cutoff
+		LOOP
+			EXECUTE format('DROP TABLE %I', part.relname);
+		END LOOP;
+		EXECUTE format('DELETE FROM %I WHERE datetime < %L', parent || '_default', cutoff);
+		EXECUTE format('DELETE FROM %I WHERE day < %L', rollup, cutoff);
+	END IF;
+
+	month := cutoff;
+	WHILE month <= this_month + make_interval(months => months_ahead) LOOP
+		BEGIN
+			EXECUTE format(
+				'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+				parent || to_char(month, '"_y"YYYY"m"MM'), parent, month, month + interval '1 month'
+			);
+		EXCEPTION WHEN check_violation THEN
+			-- the default partition already holds rows of this month
+			RAISE WARNING 'Could not create the % partition of %: %', to_char(month, 'YYYY-MM'), parent, SQLERRM;
+		END;
+		month := month + interval '1 month';
+	END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
 CREATE TABLE IF NOT EXISTS youtube_cache (
-	id SERIAL PRIMARY KEY,
-	video_id VARCHAR(255) UNIQUE NOT NULL,
+	id SERIAL,
+	video_id VARCHAR(255) NOT NULL,
 	query TEXT NOT NULL,
 	datetime TIMESTAMP NOT NULL,
-	views INTEGER,
-	likes INTEGER,
-	comments INTEGER,
+	views BIGINT,
+	likes BIGINT,
+	comments BIGINT,
 	avg_comment_sentiment REAL,
 	title_sentiment REAL,
 	weighted_sentiment REAL GENERATED ALWAYS AS ((title_sentiment * likes * 0.012) + (avg_comment_sentiment * comments * 0.988)) STORED,
-	avg_sentiment REAL GENERATED ALWAYS AS ((avg_comment_sentiment + title_sentiment) / 2) STORED
-);
+	avg_sentiment REAL GENERATED ALWAYS AS ((avg_comment_sentiment + title_sentiment) / 2) STORED,
+	-- unique keys of a partitioned table must contain the partition key, the
+	-- publish date of a video never changes so video_id alone stays unique
+	PRIMARY KEY (id, datetime),
+	UNIQUE (video_id, datetime)
+) PARTITION BY RANGE (datetime);
+
+CREATE TABLE IF NOT EXISTS youtube_cache_default PARTITION OF youtube_cache DEFAULT;
 
+-- range lookups of a brand; the charts read youtube_daily_sentiment instead,
+-- so nothing is INCLUDEd to keep ingestion writes cheap. Lookups by video_id
+-- use the unique index
 CREATE INDEX idx_youtube_cache_query_datetime ON youtube_cache (query, datetime);
 
-CREATE INDEX idx_youtube_cache_video_id ON youtube_cache (video_id);
+-- sentiment buckets of width 0.1 over [-1, 1], shared by the rollup tables
+CREATE OR REPLACE FUNCTION sentiment_bucket(sentiment REAL) RETURNS SMALLINT AS $$
+	SELECT (LEAST(GREATEST(width_bucket(sentiment, -1, 1, 20), 1), 20) - 1)::SMALLINT
+$$ LANGUAGE SQL IMMUTABLE;
+
+-- per brand, day and sentiment bucket aggregates of youtube_cache, kept up to
+-- date by the triggers below so charts never scan the raw rows
+CREATE TABLE IF NOT EXISTS youtube_daily_sentiment (
+	query TEXT NOT NULL,
+	day DATE NOT NULL,
+	bucket SMALLINT NOT NULL,
+	sentiment_count INTEGER NOT NULL,
+	sentiment_sum DOUBLE PRECISION NOT NULL,
+	sentiment_sum_sq DOUBLE PRECISION NOT NULL,
+	PRIMARY KEY (query, day, bucket)
+);
+
+CREATE OR REPLACE FUNCTION youtube_daily_sentiment_apply() RETURNS TRIGGER AS $$
+BEGIN
+	-- the charts read a missing sentiment as 0
+	IF TG_OP IN ('UPDATE', 'DELETE') THEN
+		INSERT INTO youtube_daily_sentiment AS r (query, day, bucket, sentiment_count, sentiment_sum, sentiment_sum_sq)
+		SELECT query, datetime::date, sentiment_bucket(s), -count(*), -sum(s), -sum(s * s)
+		FROM (SELECT query, datetime, COALESCE(avg_sentiment, 0) AS s FROM old_rows) o
+		GROUP BY 1, 2, 3
+		ON CONFLICT (query, day, bucket) DO UPDATE SET
+			sentiment_count = r.sentiment_count + EXCLUDED.sentiment_count,
+			sentiment_sum = r.sentiment_sum + EXCLUDED.sentiment_sum,
+			sentiment_sum_sq = r.sentiment_sum_sq + EXCLUDED.sentiment_sum_sq;
+	END IF;
+	IF TG_OP IN ('INSERT', 'UPDATE') THEN
+		INSERT INTO youtube_daily_sentiment AS r (query, day, bucket, sentiment_count, sentiment_sum, sentiment_sum_sq)
+		SELECT query, datetime::date, sentiment_bucket(s), count(*), sum(s), sum(s * s)
+		FROM (SELECT query, datetime, COALESCE(avg_sentiment, 0) AS s FROM new_rows) n
+		GROUP BY 1, 2, 3
+		ON CONFLICT (query, day, bucket) DO UPDATE SET
+			sentiment_count = r.sentiment_count + EXCLUDED.sentiment_count,
+			sentiment_sum = r.sentiment_sum + EXCLUDED.sentiment_sum,
+			sentiment_sum_sq = r.sentiment_sum_sq + EXCLUDED.sentiment_sum_sq;
+	END IF;
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- transition tables allow a single event per trigger
+CREATE OR REPLACE TRIGGER youtube_daily_sentiment_insert AFTER INSERT ON youtube_cache
+	REFERENCING NEW TABLE AS new_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION youtube_daily_sentiment_apply();
+
+CREATE OR REPLACE TRIGGER youtube_daily_sentiment_update AFTER UPDATE ON youtube_cache
+	REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION youtube_daily_sentiment_apply();
+
+CREATE OR REPLACE TRIGGER youtube_daily_sentiment_delete AFTER DELETE ON youtube_cache
+	REFERENCING OLD TABLE AS old_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION youtube_daily_sentiment_apply();
+
+SELECT maintain_cache_partitions('youtube_cache', 'youtube_daily_sentiment', 24);
+
+-- time windows of a query that were already searched on youtube, so windows
+-- with few videos are not searched again on every request
+CREATE TABLE IF NOT EXISTS youtube_fetch_coverage (
+	id SERIAL PRIMARY KEY,
+	query TEXT NOT NULL,
+	start_at TIMESTAMP NOT NULL,
+	end_at TIMESTAMP NOT NULL,
+	fetched_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+);
+
+CREATE INDEX idx_youtube_fetch_coverage_query ON youtube_fetch_coverage (query, fetched_at)
+	INCLUDE (start_at, end_at);
 
 INSERT INTO youtube_cache (video_id, query, avg_comment_sentiment, datetime) VALUES
 ('a4', 'This works much better!', 0.9, '2025-11-06 15:00:00+00');
 
 CREATE TABLE IF NOT EXISTS reddit_cache (
-	id SERIAL PRIMARY KEY,
-	post_id VARCHAR(20) UNIQUE NOT NULL,
+	id SERIAL,
+	post_id VARCHAR(20) NOT NULL,
 	query TEXT NOT NULL,
 	subreddit VARCHAR(255) NOT NULL,
 	datetime TIMESTAMP NOT NULL,
 	title_sentiment REAL,
 	avg_comment_sentiment REAL,
-	avg_sentiment REAL GENERATED ALWAYS AS ((avg_comment_sentiment + title_sentiment) / 2) STORED
-);
+	avg_sentiment REAL GENERATED ALWAYS AS ((avg_comment_sentiment + title_sentiment) / 2) STORED,
+	-- same as youtube_cache, the creation time of a post never changes
+	PRIMARY KEY (id, datetime),
+	UNIQUE (post_id, datetime)
+) PARTITION BY RANGE (datetime);
+
+CREATE TABLE IF NOT EXISTS reddit_cache_default PARTITION OF reddit_cache DEFAULT;
 
+-- range lookups of a brand, same as youtube_cache
 CREATE INDEX idx_reddit_cache_subreddit_created ON reddit_cache (query, datetime);
 
-CREATE INDEX idx_reddit_cache_post_id ON reddit_cache (post_id);
+-- per brand, day and sentiment bucket aggregates of reddit_cache
+CREATE TABLE IF NOT EXISTS reddit_daily_sentiment (
+	query TEXT NOT NULL,
+	day DATE NOT NULL,
+	bucket SMALLINT NOT NULL,
+	sentiment_count INTEGER NOT NULL,
+	sentiment_sum DOUBLE PRECISION NOT NULL,
+	sentiment_sum_sq DOUBLE PRECISION NOT NULL,
+	PRIMARY KEY (query, day, bucket)
+);
+
+CREATE OR REPLACE FUNCTION reddit_daily_sentiment_apply() RETURNS TRIGGER AS $$
+BEGIN
+	-- posts without a sentiment are left out of the charts
+	IF TG_OP IN ('UPDATE', 'DELETE') THEN
+		INSERT INTO reddit_daily_sentiment AS r (query, day, bucket, sentiment_count, sentiment_sum, sentiment_sum_sq)
+		SELECT query, datetime::date, sentiment_bucket(avg_sentiment), -count(*), -sum(avg_sentiment), -sum(avg_sentiment * avg_sentiment)
+		FROM old_rows
+		WHERE avg_sentiment IS NOT NULL
+		GROUP BY 1, 2, 3
+		ON CONFLICT (query, day, bucket) DO UPDATE SET
+			sentiment_count = r.sentiment_count + EXCLUDED.sentiment_count,
+			sentiment_sum = r.sentiment_sum + EXCLUDED.sentiment_sum,
+			sentiment_sum_sq = r.sentiment_sum_sq + EXCLUDED.sentiment_sum_sq;
+	END IF;
+	IF TG_OP IN ('INSERT', 'UPDATE') THEN
+		INSERT INTO reddit_daily_sentiment AS r (query, day, bucket, sentiment_count, sentiment_sum, sentiment_sum_sq)
+		SELECT query, datetime::date, sentiment_bucket(avg_sentiment), count(*), sum(avg_sentiment), sum(avg_sentiment * avg_sentiment)
+		FROM new_rows
+		WHERE avg_sentiment IS NOT NULL
+		GROUP BY 1, 2, 3
+		ON CONFLICT (query, day, bucket) DO UPDATE SET
+			sentiment_count = r.sentiment_count + EXCLUDED.sentiment_count,
+			sentiment_sum = r.sentiment_sum + EXCLUDED.sentiment_sum,
+			sentiment_sum_sq = r.sentiment_sum_sq + EXCLUDED.sentiment_sum_sq;
+	END IF;
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER reddit_daily_sentiment_insert AFTER INSERT ON reddit_cache
+	REFERENCING NEW TABLE AS new_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION reddit_daily_sentiment_apply();
+
+CREATE OR REPLACE TRIGGER reddit_daily_sentiment_update AFTER UPDATE ON reddit_cache
+	REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION reddit_daily_sentiment_apply();
+
+CREATE OR REPLACE TRIGGER reddit_daily_sentiment_delete AFTER DELETE ON reddit_cache
+	REFERENCING OLD TABLE AS old_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION reddit_daily_sentiment_apply();
+
+SELECT maintain_cache_partitions('reddit_cache', 'reddit_daily_sentiment', 24);
+
+-- newest post creation time ingested per subreddit, later refreshes only list
+-- the posts created after it
+CREATE TABLE IF NOT EXISTS reddit_fetch_state (
+	subreddit VARCHAR(255) PRIMARY KEY,
+	high_water_mark TIMESTAMPTZ NOT NULL,
+	fetched_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+);
 
 INSERT INTO reddit_cache (post_id, query, subreddit, datetime, title_sentiment, avg_comment_sentiment) VALUES
 ('b1', 'This works much better!', 'testsubreddit', '2025-11-06 15:00:00+00', 0.8, 0.85);
 
+-- brands waiting to be fetched from youtube / reddit, claimed by the ingestion
+-- workers of the backends with SELECT ... FOR UPDATE SKIP LOCKED
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+	id SERIAL PRIMARY KEY,
+	source TEXT NOT NULL CHECK (source IN ('youtube', 'reddit')),
+	brand TEXT NOT NULL,
+	status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed')),
+	attempts INTEGER NOT NULL DEFAULT 0,
+	error TEXT,
+	created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+	started_at TIMESTAMPTZ,
+	finished_at TIMESTAMPTZ
+);
+
+-- at most one pending job per brand and source
+CREATE UNIQUE INDEX idx_ingestion_jobs_active ON ingestion_jobs (source, brand)
+	WHERE status IN ('queued', 'running');
+
+-- the queue the workers claim from, oldest first
+CREATE INDEX idx_ingestion_jobs_queue ON ingestion_jobs (source, created_at)
+	WHERE status IN ('queued', 'running');
+
+CREATE INDEX idx_ingestion_jobs_brand ON ingestion_jobs (source, brand, created_at);
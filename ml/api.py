@@ -1,8 +1,32 @@
-from typing import Optional
-
-from fastapi import FastAPI
-from pydantic import BaseModel, Field
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+import asyncio
+import os
+from typing import AsyncIterator, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from starlette.requests import ClientDisconnect
+from starlette.types import Receive, Scope, Send
+
+from cache import CacheStats, SentimentCache
+from evaluation.models.model import Comment, SentimentModel
+from registry import (
+    MODEL_LOADERS,
+    UnknownMethodError,
+    cache_text,
+    close_models,
+    get_model,
+    loaded_models,
+    preload,
+    resolve_method,
+    set_serving_loop,
+)
+from scoring import flatten_teams, shutdown_executor, split_by_sizes, start_executor
+
+# how many streamed texts are scored together
+STREAM_CHUNK_SIZE = int(os.environ.get("STREAM_CHUNK_SIZE", 256))
 
 api = FastAPI()
 
@@ -35,6 +59,7 @@ class Team(BaseModel):
 
 class SentimentQuery(BaseModel):
     teams: list[Team]
+    method: Optional[str] = None
 
 
 class SentimentResponse(BaseModel):
@@ -46,18 +71,185 @@ class SentimentResponse(BaseModel):
     method: str
 
 
-analyzer = SentimentIntensityAnalyzer()
+class StreamItem(BaseModel):
+    text: str
+    brand: Optional[str] = None
+    title: Optional[str] = None
 
 
-def process_team_vader(team: Team) -> list[float]:
-    # todo: split each text into sentences
-    result = []
-    for text in team.texts:
-        result.append(analyzer.polarity_scores(text)["compound"])
-    return result
+class StreamScore(BaseModel):
+    index: int
+    sentiment: float
+
+
+class ModelInfo(BaseModel):
+    method: str
+    loaded: bool
+
+
+cache: Optional[SentimentCache] = None
+
+
+@api.on_event("startup")
+async def startup():
+    global cache
+    cache = SentimentCache()
+    start_executor()
+    set_serving_loop(asyncio.get_running_loop())
+    preload()
+
+
+@api.on_event("shutdown")
+def shutdown():
+    close_models()
+    shutdown_executor()
+    if cache:
+        cache.close()
+
+
+def team_comments(team: Team) -> list[Comment]:
+    return [
+        Comment(title=team.title or "", brand=team.brand or "", comment=text)
+        for text in team.texts
+    ]
+
+
+def load_model(method: Optional[str]) -> tuple[str, SentimentModel]:
+    try:
+        resolved = resolve_method(method)
+    except UnknownMethodError:
+        raise HTTPException(
+            status_code=404, detail=f"Unknown sentiment method: {method}"
+        )
+
+    try:
+        return resolved, get_model(resolved)
+    except Exception as e:
+        raise HTTPException(
+            status_code=503, detail=f"Failed to load sentiment method {resolved}: {e}"
+        )
+
+
+def score_comments(
+    method: str, model: SentimentModel, comments: list[Comment]
+) -> list[float]:
+    return cache.score(
+        method,
+        comments,
+        model.get_sentiment,
+        text_of=lambda comment: cache_text(method, comment),
+    )
 
 
 @api.post("/get_sentiment")
 def get_sentiment(query: SentimentQuery) -> SentimentResponse:
-    result = [process_team_vader(team) for team in query.teams]
-    return SentimentResponse(sentiment=result, method="vader")
+    method, model = load_model(query.method)
+
+    # todo: split each text into sentences
+    comments, sizes = flatten_teams([team_comments(team) for team in query.teams])
+    try:
+        scores = score_comments(method, model, comments)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error scoring texts: {e}")
+    return SentimentResponse(sentiment=split_by_sizes(scores, sizes), method=method)
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse whose body iterator reads the request body itself.
+
+    The stock one listens for disconnects on receive() while streaming, which
+    would take the request body chunks away from the iterator. A disconnect
+    still ends the stream, as ClientDisconnect from request.stream().
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await self.stream_response(send)
+
+
+async def read_ndjson_lines(request: Request) -> AsyncIterator[bytes]:
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+async def stream_scores(
+    request: Request, method: str, model: SentimentModel
+) -> AsyncIterator[str]:
+    index = 0
+    chunk: list[Comment] = []
+
+    async def flush() -> list[str]:
+        nonlocal index
+        # scoring blocks (and batched models wait on this loop), keep it off the loop
+        scores = await run_in_threadpool(score_comments, method, model, chunk)
+        lines = []
+        for score in scores:
+            lines.append(
+                StreamScore(index=index, sentiment=score).model_dump_json() + "\n"
+            )
+            index += 1
+        chunk.clear()
+        return lines
+
+    try:
+        async for line in read_ndjson_lines(request):
+            try:
+                item = StreamItem.model_validate_json(line)
+            except ValidationError:
+                invalid = index + len(chunk)
+                # the items before the invalid line are still scored
+                if chunk:
+                    for out in await flush():
+                        yield out
+                # the status code is already sent, so errors go into the stream
+                yield f'{{"error": "Invalid line {invalid}"}}\n'
+                return
+            chunk.append(
+                Comment(
+                    title=item.title or "", brand=item.brand or "", comment=item.text
+                )
+            )
+            if len(chunk) >= STREAM_CHUNK_SIZE:
+                for out in await flush():
+                    yield out
+        if chunk:
+            for out in await flush():
+                yield out
+    except ClientDisconnect:
+        return
+    except Exception as e:
+        print(f"Error while streaming sentiment: {e}")
+        yield '{"error": "Error scoring texts"}\n'
+
+
+@api.post("/get_sentiment/stream")
+async def get_sentiment_stream(request: Request, method: Optional[str] = None):
+    """Score newline-delimited json texts ({"text": ..., "brand": ..., "title": ...}).
+
+    Scores are streamed back as ndjson ({"index": ..., "sentiment": ...}) in
+    input order, every STREAM_CHUNK_SIZE texts. An invalid line ends the stream
+    with an error line, after the scores of the lines before it.
+    """
+    method, model = await run_in_threadpool(load_model, method)
+    return DuplexStreamingResponse(
+        stream_scores(request, method, model), media_type="application/x-ndjson"
+    )
+
+
+@api.get("/models")
+def get_models() -> list[ModelInfo]:
+    return [
+        ModelInfo(method=method, loaded=method in loaded_models)
+        for method in MODEL_LOADERS
+    ]
+
+
+@api.get("/cache/stats")
+def get_cache_stats() -> CacheStats:
+    return cache.stats()
@@ -0,0 +1,101 @@
+"""Dynamic micro-batching for transformer models.
+
+Texts from concurrent requests are collected for a few milliseconds, sorted by
+length so that similar texts end up in the same batch (less padding), and run
+through the model one batch at a time. Each request then gets its own scores
+back.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 32))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", 5))
+# how many batches worth of texts are collected before they are bucketed
+BATCHES_PER_ROUND = int(os.environ.get("BATCHES_PER_ROUND", 8))
+
+
+class MicroBatcher:
+
+    def __init__(
+        self,
+        score_fn: Callable[[list[str]], list[float]],
+        loop: asyncio.AbstractEventLoop,
+        max_batch_size: int = BATCH_MAX_SIZE,
+        max_wait_ms: float = BATCH_MAX_WAIT_MS,
+    ):
+        self.score_fn = score_fn
+        self.loop = loop
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_round_size = max_batch_size * BATCHES_PER_ROUND
+
+        self.queue: asyncio.Queue[tuple[str, asyncio.Future]] = asyncio.Queue()
+        # one forward pass at a time, the model already uses all cores itself
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.task: asyncio.Task | None = None
+
+    async def submit(self, texts: list[str]) -> list[float]:
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+        futures = []
+        for text in texts:
+            future = self.loop.create_future()
+            self.queue.put_nowait((text, future))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    def submit_threadsafe(self, texts: list[str]) -> list[float]:
+        """Blocking submit for code running outside the event loop thread."""
+        return asyncio.run_coroutine_threadsafe(self.submit(texts), self.loop).result()
+
+    async def collect(self) -> list[tuple[str, asyncio.Future]]:
+        pending = [await self.queue.get()]
+        deadline = self.loop.time() + self.max_wait
+        while len(pending) < self.max_round_size:
+            if not self.queue.empty():
+                pending.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - self.loop.time()
+            if timeout <= 0:
+                break
+            try:
+                pending.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except TimeoutError:
+                break
+        return pending
+
+    async def run_batch(self, batch: list[tuple[str, asyncio.Future]]):
+        batch = [(text, future) for text, future in batch if not future.done()]
+        if not batch:
+            return
+
+        try:
+            scores = await self.loop.run_in_executor(
+                self.executor, self.score_fn, [text for text, _ in batch]
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), score in zip(batch, scores):
+            if not future.done():
+                future.set_result(score)
+
+    async def run(self):
+        while True:
+            pending = await self.collect()
+            pending.sort(key=lambda item: len(item[0]))
+            for i in range(0, len(pending), self.max_batch_size):
+                await self.run_batch(pending[i : i + self.max_batch_size])
+
+    def close(self):
+        if self.task is not None:
+            self.loop.call_soon_threadsafe(self.task.cancel)
+            self.task = None
+        self.executor.shutdown(wait=False, cancel_futures=True)
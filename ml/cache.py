@@ -0,0 +1,160 @@
+"""Content-addressed cache for sentiment scores.
+
+Scores are keyed by a hash of (method, normalized text). Lookups go through an
+in-process LRU first and an optional SQLite file second, so cached scores
+survive restarts of the service.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, TypeVar
+
+from pydantic import BaseModel
+
+CACHE_SIZE = int(os.environ.get("SENTIMENT_CACHE_SIZE", 100_000))
+CACHE_PATH = os.environ.get("SENTIMENT_CACHE_PATH")  # disk tier is off when unset
+
+# sqlite limits the number of host parameters in one statement
+SQLITE_BATCH = 500
+
+T = TypeVar("T")
+
+
+class CacheStats(BaseModel):
+    memory_hits: int
+    disk_hits: int
+    misses: int
+    memory_size: int
+    memory_capacity: int
+    disk_enabled: bool
+
+
+def normalize_text(text: str) -> str:
+    # case is kept on purpose: vader treats capitals as emphasis
+    return " ".join(text.split())
+
+
+def cache_key(method: str, text: str) -> bytes:
+    return hashlib.blake2b(
+        f"{method}\0{normalize_text(text)}".encode(), digest_size=16
+    ).digest()
+
+
+class SentimentCache:
+
+    def __init__(self, max_size: int = CACHE_SIZE, path: Optional[str] = CACHE_PATH):
+        self.max_size = max_size
+        self.memory: OrderedDict[bytes, float] = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS sentiment_cache (key BLOB PRIMARY KEY, score REAL NOT NULL)"
+            )
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+    def _remember(self, key: bytes, score: float):
+        self.memory[key] = score
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+
+    def _read_disk(self, keys: list[bytes]) -> dict[bytes, float]:
+        found = {}
+        for i in range(0, len(keys), SQLITE_BATCH):
+            batch = keys[i : i + SQLITE_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.db.execute(
+                f"SELECT key, score FROM sentiment_cache WHERE key IN ({placeholders})",
+                batch,
+            )
+            found.update(rows)
+        return found
+
+    def get_many(self, keys: list[bytes]) -> dict[bytes, float]:
+        found = {}
+        with self.lock:
+            for key in keys:
+                score = self.memory.get(key)
+                if score is not None:
+                    self.memory.move_to_end(key)
+                    found[key] = score
+            self.memory_hits += len(found)
+
+            missing = [key for key in keys if key not in found]
+            if missing and self.db is not None:
+                from_disk = self._read_disk(missing)
+                for key, score in from_disk.items():
+                    self._remember(key, score)
+                found.update(from_disk)
+                self.disk_hits += len(from_disk)
+
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: dict[bytes, float]):
+        with self.lock:
+            for key, score in items.items():
+                self._remember(key, score)
+            if self.db is not None:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO sentiment_cache (key, score) VALUES (?, ?)",
+                    items.items(),
+                )
+                self.db.commit()
+
+    def score(
+        self,
+        method: str,
+        items: list[T],
+        score_fn: Callable[[list[T]], list[float]],
+        text_of: Callable[[T], str] = str,
+    ) -> list[float]:
+        """Return scores for items, calling score_fn only for unseen ones.
+
+        text_of gives the text an item is cached under. Duplicates inside
+        one call are scored once.
+        """
+        keys = [cache_key(method, text_of(item)) for item in items]
+        unique_keys = list(dict.fromkeys(keys))
+        found = self.get_many(unique_keys)
+
+        todo = {}
+        for key, item in zip(keys, items):
+            if key not in found and key not in todo:
+                todo[key] = item
+
+        if todo:
+            fresh = dict(zip(todo.keys(), score_fn(list(todo.values()))))
+            self.put_many(fresh)
+            found.update(fresh)
+
+        return [found[key] for key in keys]
+
+    def stats(self) -> CacheStats:
+        with self.lock:
+            return CacheStats(
+                memory_hits=self.memory_hits,
+                disk_hits=self.disk_hits,
+                misses=self.misses,
+                memory_size=len(self.memory),
+                memory_capacity=self.max_size,
+                disk_enabled=self.db is not None,
+            )
@@ -14,22 +14,37 @@ def sentiment_to_score(prediction: dict):
 
 class HfModel(SentimentModel):
 
-    def __init__(self, model_id: str, description: str | None = None):
+    def __init__(
+        self, model_id: str, description: str | None = None, batch_size: int = 8
+    ):
         if description is None:
             description = model_id
         super().__init__(name=model_id, description=description)
+        self.batch_size = batch_size
         self.model = pipeline("text-classification", model_id)
 
     def get_sentiment(self, comments: list[Comment]) -> list[float]:
         # print(list(comment.comment for comment in comments))
         # assert all(isinstance(comment.comment, str) for comment in comments) 
-        sentiments = self.model(list(comment.comment for comment in comments))
+        sentiments = self.model(
+            list(comment.comment for comment in comments),
+            batch_size=self.batch_size,
+            truncation=True,
+        )
         return [sentiment_to_score(p) for p in sentiments]
 
 
-export_models = [
-    HfModel("cardiffnlp/twitter-roberta-base-sentiment-latest"),
-    HfModel("cardiffnlp/twitter-xlm-roberta-base-sentiment"),
-    HfModel("nlptown/bert-base-multilingual-uncased-sentiment"),
-    HfModel("lxyuan/distilbert-base-multilingual-cased-sentiments-student"),
+export_model_ids = [
+    "cardiffnlp/twitter-roberta-base-sentiment-latest",
+    "cardiffnlp/twitter-xlm-roberta-base-sentiment",
+    "nlptown/bert-base-multilingual-uncased-sentiment",
+    "lxyuan/distilbert-base-multilingual-cased-sentiments-student",
 ]
+
+
+def __getattr__(name: str):
+    # loading the pipelines is slow, so only do it when the list is asked for
+    # (the serving api imports HfModel without wanting all of them)
+    if name == "export_models":
+        return [HfModel(model_id) for model_id in export_model_ids]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
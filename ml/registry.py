@@ -0,0 +1,156 @@
+"""Registry of the sentiment models the api can serve.
+
+The models come from the evaluation harness (evaluation/models). They are
+imported and loaded lazily on first use and then kept in memory, so only the
+models that are actually requested pay the load cost, and only once.
+"""
+
+import asyncio
+import os
+import threading
+from typing import Callable
+
+from batching import BATCH_MAX_SIZE, MicroBatcher
+from evaluation.models.model import Comment, SentimentModel
+from evaluation.models.vader import VaderModel
+from scoring import score_texts_vader
+
+DEFAULT_METHOD = os.environ.get("SENTIMENT_METHOD", "vader")
+# comma separated list of methods loaded at startup
+PRELOAD_METHODS = os.environ.get("SENTIMENT_PRELOAD", DEFAULT_METHOD)
+
+
+class PooledVaderModel(VaderModel):
+    """Vader that spreads large batches over the scoring process pool."""
+
+    def get_sentiment(self, comments: list[Comment]) -> list[float]:
+        return score_texts_vader([comment.comment for comment in comments])
+
+
+class BatchedModel(SentimentModel):
+    """Routes texts through a MicroBatcher so concurrent requests share batches."""
+
+    def __init__(self, model: SentimentModel):
+        super().__init__(model.name, model.description)
+        self.model = model
+        self.batcher = MicroBatcher(self.score_texts, serving_loop)
+
+    def score_texts(self, texts: list[str]) -> list[float]:
+        return self.model.get_sentiment(
+            [Comment(title="", brand="", comment=text) for text in texts]
+        )
+
+    def get_sentiment(self, comments: list[Comment]) -> list[float]:
+        return self.batcher.submit_threadsafe([comment.comment for comment in comments])
+
+
+def load_textblob() -> SentimentModel:
+    from evaluation.models.textblob import TextBlobModel
+
+    return TextBlobModel("textblob", "basic textblob")
+
+
+def hf_loader(model_id: str) -> Callable[[], SentimentModel]:
+    def load() -> SentimentModel:
+        from evaluation.models.hf import HfModel
+
+        return BatchedModel(HfModel(model_id, batch_size=BATCH_MAX_SIZE))
+
+    return load
+
+
+def load_gemini() -> SentimentModel:
+    from evaluation.models.gemini import GeminiModel
+
+    return GeminiModel("gemini", "default gemini model")
+
+
+def ollama_loader(model_id: str) -> Callable[[], SentimentModel]:
+    def load() -> SentimentModel:
+        from evaluation.models.ollama import OllamaModel
+
+        return OllamaModel(model_id)
+
+    return load
+
+
+MODEL_LOADERS: dict[str, Callable[[], SentimentModel]] = {
+    "vader": lambda: PooledVaderModel("vader", "vader simple vader"),
+    "textblob": load_textblob,
+    "cardiffnlp/twitter-roberta-base-sentiment-latest": hf_loader(
+        "cardiffnlp/twitter-roberta-base-sentiment-latest"
+    ),
+    "cardiffnlp/twitter-xlm-roberta-base-sentiment": hf_loader(
+        "cardiffnlp/twitter-xlm-roberta-base-sentiment"
+    ),
+    "nlptown/bert-base-multilingual-uncased-sentiment": hf_loader(
+        "nlptown/bert-base-multilingual-uncased-sentiment"
+    ),
+    "lxyuan/distilbert-base-multilingual-cased-sentiments-student": hf_loader(
+        "lxyuan/distilbert-base-multilingual-cased-sentiments-student"
+    ),
+    "gemini": load_gemini,
+    "gemma3:1b": ollama_loader("gemma3:1b"),
+    "gemma3:4b": ollama_loader("gemma3:4b"),
+}
+
+# the llm prompts score sentiment towards the brand given the title, so the
+# same text can get a different score in a different team
+CONTEXT_METHODS = {"gemini", "gemma3:1b", "gemma3:4b"}
+
+loaded_models: dict[str, SentimentModel] = {}
+# the loop of the api, micro-batchers schedule their work on it
+serving_loop: asyncio.AbstractEventLoop | None = None
+load_locks = {method: threading.Lock() for method in MODEL_LOADERS}
+
+
+class UnknownMethodError(KeyError):
+    pass
+
+
+def resolve_method(method: str | None) -> str:
+    method = method or DEFAULT_METHOD
+    if method not in MODEL_LOADERS:
+        raise UnknownMethodError(method)
+    return method
+
+
+def get_model(method: str) -> SentimentModel:
+    model = loaded_models.get(method)
+    if model is not None:
+        return model
+
+    with load_locks[method]:
+        # another request may have loaded it while we waited for the lock
+        if method not in loaded_models:
+            print(f"Loading sentiment model {method}...")
+            loaded_models[method] = MODEL_LOADERS[method]()
+        return loaded_models[method]
+
+
+def set_serving_loop(loop: asyncio.AbstractEventLoop):
+    global serving_loop
+    serving_loop = loop
+
+
+def close_models():
+    for model in loaded_models.values():
+        if isinstance(model, BatchedModel):
+            model.batcher.close()
+
+
+def preload():
+    for method in PRELOAD_METHODS.split(","):
+        method = method.strip()
+        if not method:
+            continue
+        try:
+            get_model(resolve_method(method))
+        except Exception as e:
+            print(f"Failed to preload sentiment model {method}: {e}")
+
+
+def cache_text(method: str, comment: Comment) -> str:
+    if method in CONTEXT_METHODS:
+        return f"{comment.brand}\0{comment.title}\0{comment.comment}"
+    return comment.comment
@@ -0,0 +1,74 @@
+"""Batched sentiment scoring for the ML service.
+
+All texts of a request are flattened into a single work list, scored in bulk
+and split back into per-team lists afterwards. VADER is pure Python and
+CPU-bound, so large batches are spread over a process pool.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+from typing import TypeVar
+
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
+SCORING_WORKERS = int(os.environ.get("SCORING_WORKERS", os.cpu_count() or 1))
+# batches smaller than this are scored in-process, the pool overhead is not worth it
+MIN_CHUNK_SIZE = int(os.environ.get("SCORING_MIN_CHUNK_SIZE", 256))
+
+T = TypeVar("T")
+
+analyzer = SentimentIntensityAnalyzer()
+executor: ProcessPoolExecutor | None = None
+
+
+def start_executor():
+    """Start the worker processes, from the startup hook of the app.
+
+    The server already runs threads by then, so the workers are spawned
+    rather than forked. They are started and have loaded VADER before the
+    first request instead of during it.
+    """
+    global executor
+    if executor is None and SCORING_WORKERS > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=SCORING_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+        # one task per worker, submitted together so every process is started
+        list(executor.map(score_chunk_vader, [[""]] * SCORING_WORKERS))
+
+
+def shutdown_executor():
+    global executor
+    if executor is not None:
+        executor.shutdown(cancel_futures=True)
+        executor = None
+
+
+def flatten_teams(teams: list[list[T]]) -> tuple[list[T], list[int]]:
+    items = list(chain.from_iterable(teams))
+    sizes = [len(team) for team in teams]
+    return items, sizes
+
+
+def split_by_sizes(scores: list[float], sizes: list[int]) -> list[list[float]]:
+    it = iter(scores)
+    return [list(islice(it, size)) for size in sizes]
+
+
+def chunked(texts: list[str], size: int) -> list[list[str]]:
+    return [texts[i : i + size] for i in range(0, len(texts), size)]
+
+
+def score_chunk_vader(texts: list[str]) -> list[float]:
+    return [analyzer.polarity_scores(text)["compound"] for text in texts]
+
+
+def score_texts_vader(texts: list[str]) -> list[float]:
+    if executor is None or len(texts) < 2 * MIN_CHUNK_SIZE:
+        return score_chunk_vader(texts)
+
+    chunk_size = max(MIN_CHUNK_SIZE, -(-len(texts) // SCORING_WORKERS))
+    results = executor.map(score_chunk_vader, chunked(texts, chunk_size))
+    return list(chain.from_iterable(results))
@@ -1,22 +1,29 @@
 import os
+import threading
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, Depends
 from fastapi.exceptions import HTTPException
 import psycopg2
-from psycopg2 import pool
 
+from charts.context import load_chart_context
 from charts.latest_histogram import histogram_sentiment
 from charts.time_series import time_series_sentiment
-from models import Chart
+from db import get_latest_job, maintain_partitions, purge_jobs
+from db_pool import ConnectionPool, PoolStats, PoolTimeoutError
+from models import Chart, IngestionJob
+from worker import SOURCE, queue_brand, start_ingestion_workers, stop_ingestion_workers
 
 load_dotenv()
 
 
 ML_URL = os.environ.get("ML_URL")  # todo: env var
+PARTITION_MAINTENANCE_INTERVAL = float(os.environ.get("PARTITION_MAINTENANCE_INTERVAL_HOURS", 24)) * 3600
 
 api = FastAPI()
 db_pool = None
+maintenance_timer = None
+ingestion_workers = []
 # print(requests.get("http://localhost:10001/docs").json())
 
 
@@ -52,46 +59,64 @@ db_pool = None
 
 @api.on_event("startup")
 def startup():
-    global db_pool
-    db_pool = psycopg2.pool.SimpleConnectionPool(
-        1,
-        10,
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        host=os.getenv("DB_HOST"),
-        port=os.getenv("DB_PORT"),
-        database=os.getenv("DB_NAME"),
-    )
+    global db_pool, ingestion_workers
+    db_pool = ConnectionPool()
+    run_partition_maintenance()
+    ingestion_workers = start_ingestion_workers(db_pool)
+
+def run_partition_maintenance():
+    # partitions are only created a few months ahead, so keep doing it while running
+    global maintenance_timer
+    try:
+        with db_pool.connection() as conn:
+            maintain_partitions(conn)
+            purge_jobs(conn)
+    except Exception as e:
+        print(f"Skipping partition maintenance: {e}")
+    finally:
+        maintenance_timer = threading.Timer(PARTITION_MAINTENANCE_INTERVAL, run_partition_maintenance)
+        maintenance_timer.daemon = True
+        maintenance_timer.start()
 
 @api.on_event("shutdown")
 def shutdown():
     global db_pool
+    if maintenance_timer:
+        maintenance_timer.cancel()
+    # the workers give back their connections before the pool closes them
+    stop_ingestion_workers(ingestion_workers)
     if db_pool:
-        db_pool.closeall()
+        db_pool.close()
 
 def get_db_connection():
     global db_pool
     try:
-        conn = db_pool.getconn()
-        yield conn
-    finally:
-        db_pool.putconn(conn)
+        with db_pool.connection() as conn:
+            yield conn
+    except PoolTimeoutError as e:
+        raise HTTPException(status_code=503, detail=f"Database busy: {e}")
 
 
 def get_charts_inner(brands: list[str], conn: psycopg2) -> list[Chart]:
     charts = []
 
     try:
+        # every chart is built from the same data, loaded once
+        context = load_chart_context(conn, brands)
+        # the posts are fetched in the background, the charts show what is cached
+        if context.reddit_configured:
+            for brand in dict.fromkeys(brands):
+                queue_brand(conn, brand)
         charts.extend(
             [
                 Chart(
                     title="Sentiment histogram",
-                    plotly_json=histogram_sentiment(conn, brands),
+                    plotly_json=histogram_sentiment(context),
                 ),
                 # Chart(title="Combined histogram", plotly_json=histogram_combined([brand])),
                 Chart(
                     title="Sentiment time series",
-                    plotly_json=time_series_sentiment(conn, brands),
+                    plotly_json=time_series_sentiment(context),
                 ),
                 # Chart(title="Views time series", plotly_json=time_series_views([brand])),
                 # Chart(title="Combined time series", plotly_json=time_series_combined([brand])),
@@ -111,3 +136,25 @@ def get_charts(brand: str, conn=Depends(get_db_connection)) -> list[Chart]:
 @api.post("/charts/multibrand")
 def get_charts_multibrand(brands: list[str], conn=Depends(get_db_connection)) -> list[Chart]:
     return get_charts_inner(brands, conn)
+
+
+@api.post("/ingest")
+def ingest_brand(brand: str, conn=Depends(get_db_connection)) -> IngestionJob:
+    """Queue a fresh fetch of the brand, the charts pick it up once it is done."""
+    job = queue_brand(conn, brand, force=True)
+    if job is None:
+        raise HTTPException(status_code=500, detail=f"Could not queue {brand}")
+    return job
+
+
+@api.get("/ingest")
+def get_ingestion_status(brand: str, conn=Depends(get_db_connection)) -> IngestionJob:
+    job = get_latest_job(conn, SOURCE, brand)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"{brand} was never queued")
+    return job
+
+
+@api.get("/db/stats")
+def get_db_stats() -> PoolStats:
+    return db_pool.stats()
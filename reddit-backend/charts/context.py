@@ -0,0 +1,65 @@
+"""Data shared by the chart builders of one request.
+
+The rollup is read once for the widest window any chart shows; the builders
+only slice that frame. The posts are fetched by the ingestion worker, with a
+Reddit client per thread.
+"""
+import os
+import threading
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Optional
+
+import pandas as pd
+import praw
+
+from db import get_daily_sentiment
+
+from .reddit_access import init_reddit
+
+# the widest window any chart shows
+HISTORY_DAYS = 30
+
+# PRAW clients are not thread-safe, every thread (request threadpool,
+# ingestion workers) gets its own, like the comment fetchers of charts.ingestion
+thread_state = threading.local()
+
+
+@lru_cache(maxsize=None)
+def reddit_credentials() -> Optional[tuple[str, str, Optional[str]]]:
+    """Read once per process, None if they are not configured."""
+    client_id = os.environ.get("REDDIT_APP_ID")
+    client_secret = os.environ.get("REDDIT_APP_SECRET")
+    if not client_id or not client_secret:
+        return None
+    return client_id, client_secret, os.environ.get("REDDIT_APP_NAME")
+
+
+def get_reddit() -> Optional[praw.Reddit]:
+    """The client of the calling thread, None if the credentials are not configured."""
+    credentials = reddit_credentials()
+    if credentials is None:
+        return None
+    if getattr(thread_state, "client", None) is None:
+        thread_state.client = init_reddit(*credentials)
+    return thread_state.client
+
+
+@dataclass
+class ChartContext:
+    brands: list[str]
+    end: date
+    # daily sentiment rollup of the brands over the last HISTORY_DAYS days
+    rollup: pd.DataFrame
+    reddit_configured: bool = True
+
+    def last_days(self, days: int) -> pd.DataFrame:
+        return self.rollup[self.rollup["day"] >= self.end - timedelta(days=days)]
+
+
+def load_chart_context(conn, brands: list[str]) -> ChartContext:
+    """What is cached for the brands, the ingestion worker fills in the rest."""
+    end = datetime.now().date()
+    rollup = get_daily_sentiment(conn, brands, end - timedelta(days=HISTORY_DAYS), end)
+    return ChartContext(brands, end, rollup, reddit_configured=reddit_credentials() is not None)
@@ -0,0 +1,102 @@
+"""Concurrent loading of Reddit comment trees.
+
+Every post's comment tree is its own request, so they are fetched by a bounded
+thread pool. PRAW clients are not thread-safe, each worker thread gets its own
+client with the credentials of the caller's client. The workers share one view
+of Reddit's rate-limit headers, so together they stay within the budget of the
+OAuth app.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import praw
+
+REDDIT_WORKERS = int(os.environ.get("REDDIT_WORKERS", 8))
+# reddit counts requests in windows of 10 minutes
+RATE_LIMIT_WINDOW = 600
+
+
+class RateLimit:
+    """Requests left in the current window, as reported by the x-ratelimit headers."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.remaining: Optional[float] = None
+        self.reset_at = 0.0
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.time()
+                if self.remaining is None or self.remaining >= 1 or now >= self.reset_at:
+                    if self.remaining is not None:
+                        # reserve the request, the headers of its response come later
+                        self.remaining -= 1
+                    return
+                delay = self.reset_at - now
+            print(f"Reddit rate limit reached, waiting {delay:.0f}s")
+            time.sleep(delay)
+
+    def update(self, limits: dict):
+        remaining = limits.get("remaining")
+        if remaining is None:
+            return
+        now = time.time()
+        reset_at = limits.get("reset_timestamp") or now + RATE_LIMIT_WINDOW - now % RATE_LIMIT_WINDOW
+        with self.lock:
+            self.remaining = remaining
+            self.reset_at = reset_at
+
+
+rate_limit = RateLimit()
+executor = ThreadPoolExecutor(max_workers=REDDIT_WORKERS, thread_name_prefix="reddit")
+worker_state = threading.local()
+
+
+def worker_client(reddit: praw.Reddit) -> praw.Reddit:
+    config = reddit.config
+    key = (config.client_id, config.client_secret, config.user_agent)
+    if getattr(worker_state, "key", None) != key:
+        worker_state.client = praw.Reddit(
+            client_id=config.client_id,
+            client_secret=config.client_secret,
+            user_agent=config.user_agent
+        )
+        worker_state.key = key
+    return worker_state.client
+
+
+def fetch_comment_tree(reddit: praw.Reddit, sub: str, post_id: str, replace_more_limit: int, max_comments: Optional[int]) -> list[dict]:
+    client = worker_client(reddit)
+    rate_limit.acquire()
+    submission = client.submission(id=post_id)
+    submission.comments.replace_more(limit=replace_more_limit)
+    comments = submission.comments.list()[:max_comments]
+    rate_limit.update(client.auth.limits)
+    return [
+        {
+            "subreddit": sub,
+            "post_id": post_id,
+            "id": comment.id,
+            "content": comment.body,
+            "created_utc": comment.created_utc,
+            "score": comment.score
+        }
+        for comment in comments
+    ]
+
+
+def fetch_comments(reddit: praw.Reddit, sub: str, post_ids: list[str], replace_more_limit: int = 0, max_comments: Optional[int] = None) -> list[list[dict]]:
+    """The comments of each post, in the order of post_ids."""
+    if not post_ids:
+        return []
+    # the listing that produced the posts went through the caller's client
+    rate_limit.update(reddit.auth.limits)
+    futures = [
+        executor.submit(fetch_comment_tree, reddit, sub, post_id, replace_more_limit, max_comments)
+        for post_id in post_ids
+    ]
+    return [future.result() for future in futures]
@@ -1,13 +1,26 @@
+import os
 import praw
 import pandas as pd
 from datetime import datetime
 from typing import List
 from models import PostCache
-from db import search_post_database, insert_post_cache
+from db import (
+    count_posts,
+    get_cached_post_ids,
+    get_high_water_mark,
+    insert_post_cache_bulk,
+    search_post_database,
+    set_high_water_mark,
+)
 import datetime as dt
+from .ingestion import fetch_comments
 from .ml_client import get_sentiment
 import numpy as np
 import time
+from itertools import takewhile
+
+# overwrite the sentiment of already cached posts when they are fetched again
+UPDATE_SENTIMENT = os.environ.get("REDDIT_UPDATE_SENTIMENT", "false").lower() == "true"
 
 
 def init_reddit(client_id, client_secret, user_agent):
@@ -21,32 +34,42 @@ def init_reddit(client_id, client_secret, user_agent):
 def fetch_top_posts(reddit_client, subreddits: list[str], time_filter="month", limit=100):
     """Fetch top posts and comments from subreddits (no keyword restriction)"""
     posts, comments = [], []
-    
+
     for sub in subreddits:
         subreddit = reddit_client.subreddit(sub)
-        for post in subreddit.top(time_filter=time_filter, limit=limit):
-            posts.append({
-                "subreddit": sub,
-                "id": post.id,
-                "title": post.title,
-                "content": post.selftext,
-                "created_utc": post.created_utc,
-                "score": post.score,
-                "num_comments": post.num_comments
-            })
-            
-            post.comments.replace_more(limit=0)
-            for comment in post.comments.list():
-                comments.append({
-                    "subreddit": sub,
-                    "post_id": post.id,
-                    "content": comment.body,
-                    "created_utc": comment.created_utc,
-                    "score": comment.score
-                })
-    
+        sub_posts, sub_comments = submissions_to_frames(reddit_client, sub, subreddit.top(time_filter=time_filter, limit=limit))
+        posts.append(sub_posts)
+        comments.append(sub_comments)
+
+    return pd.concat(posts, ignore_index=True), pd.concat(comments, ignore_index=True)
+
+def submissions_to_frames(reddit_client, sub: str, submissions):
+    """Posts and their comments as dataframes; the comment trees are fetched concurrently"""
+    posts = [
+        {
+            "subreddit": sub,
+            "id": post.id,
+            "title": post.title,
+            "content": post.selftext,
+            "created_utc": post.created_utc,
+            "score": post.score,
+            "num_comments": post.num_comments
+        }
+        for post in submissions
+    ]
+    comment_trees = fetch_comments(reddit_client, sub, [post["id"] for post in posts])
+    comments = [comment for tree in comment_trees for comment in tree]
+
     return pd.DataFrame(posts), pd.DataFrame(comments)
 
+def list_new_posts(reddit_client, sub: str, high_water_mark: datetime, limit=100):
+    """Posts of a subreddit created after the high-water mark, newest first (no comments)"""
+    cutoff = high_water_mark.timestamp()
+    return list(takewhile(
+        lambda post: post.created_utc > cutoff,
+        reddit_client.subreddit(sub).new(limit=limit)
+    ))
+
 def fetch_keyword_search(reddit_client, subreddits: list[str], keywords: list[str], 
                          time_filter="year", limit_per_sub=50):
     """Fetch posts and comments based on keyword search"""
@@ -56,9 +79,13 @@ def fetch_keyword_search(reddit_client, subreddits: list[str], keywords: list[st
         subreddit = reddit_client.subreddit(subreddit_name)
         
         for keyword in keywords:
-            search_results = subreddit.search(keyword, time_filter=time_filter, limit=limit_per_sub)
-            
-            for submission in search_results:
+            search_results = list(subreddit.search(keyword, time_filter=time_filter, limit=limit_per_sub))
+            comment_trees = fetch_comments(
+                reddit_client, subreddit_name, [submission.id for submission in search_results],
+                replace_more_limit=5, max_comments=20
+            )
+
+            for submission, comments in zip(search_results, comment_trees):
                 all_data.append({
                     'type': 'post',
                     'id': submission.id,
@@ -71,15 +98,14 @@ def fetch_keyword_search(reddit_client, subreddits: list[str], keywords: list[st
                     'keyword': keyword
                 })
                 
-                submission.comments.replace_more(limit=5)
-                for comment in submission.comments.list()[:20]:
+                for comment in comments:
                     all_data.append({
                         'type': 'comment',
-                        'id': comment.id,
+                        'id': comment["id"],
                         'post_id': submission.id,
-                        'content': comment.body,
-                        'score': comment.score,
-                        'created_utc': comment.created_utc,
+                        'content': comment["content"],
+                        'score': comment["score"],
+                        'created_utc': comment["created_utc"],
                         'subreddit': subreddit_name,
                         'keyword': keyword
                     })
@@ -97,50 +123,83 @@ def get_all_post_data(conn, reddit, brand, limit_per_sub, cutoff = None) -> List
     # print("Found %d cached posts for brand %s" % (len(post_data), brand))
 
     if len(post_data) < limit_per_sub:
-        try:
-            posts_df, comments_df = fetch_top_posts(reddit, [brand], time_filter="month", limit=limit_per_sub) # limit=limit_per_sub+50 if want to get more posts
-        except Exception as e:
-            print("Error fetching reddit data for %s: %s" % (brand, e))
-            posts_df = pd.DataFrame()
-            comments_df = pd.DataFrame()
-
-        # If there are no posts returned, bail out
-        if posts_df is None or posts_df.empty:
-            # elapsed = time.perf_counter() - start
-            # print("get_all_post_data for %s returned %d posts in %.3fs (no new posts)" % (brand, len(post_data), elapsed))
-            return post_data
-
-        # Iterate over fetched posts and attach comment sentiments
-        for _, row in posts_df.iterrows():
-            date = datetime.fromtimestamp(row.get("created_utc"))
-            # if cutoff is None or date > cutoff:
-            #     continue
-            comments_for_post = comments_df[comments_df["post_id"] == row["id"]] if not comments_df.empty else pd.DataFrame()
-            title = (str(row.get("title", "")) + " " + str(row.get("content", ""))).strip()
-            title_sentiment = get_sentiment([title])[0]
-            comment_texts = comments_for_post["content"].tolist() if not comments_for_post.empty else []
-            comment_sentiments = get_sentiment(comment_texts)
-            avg_comment_sentiment = np.mean(comment_sentiments) if comment_sentiments else 0.0
-            combined_sentiment = np.mean([title_sentiment, avg_comment_sentiment])
-            try:
-                post_cache = PostCache(
-                    post_id=row["id"],
-                    query=brand,
-                    subreddit=row.get("subreddit", "all"),
-                    datetime=datetime.fromtimestamp(row.get("created_utc")),
-                    title_sentiment=title_sentiment,
-                    avg_comment_sentiment=avg_comment_sentiment,
-                    avg_sentiment=combined_sentiment
-                )
-            except Exception as e:
-                print(f"Error creating PostCache for post_id {row['id']}: {e}")
-                continue
-            post_data.append(post_cache)
-            try:
-                insert_post_cache(conn, post_cache)
-            except Exception as e:
-                print("Error inserting PostCache into database for post_id %s: %s" % (row['id'], e))
-                continue
+        post_data.extend(download_post_data(conn, reddit, brand, limit_per_sub))
     # elapsed = time.perf_counter() - start
     # print("get_all_post_data for %s returned %d posts in %.3fs" % (brand, len(post_data), elapsed))
-    return post_data
\ No newline at end of file
+    return post_data
+
+
+def ensure_post_data(conn, reddit, brand, limit_per_sub):
+    """Like get_all_post_data, but only makes sure the cache is filled.
+
+    The cached posts are counted in the rollup table instead of being loaded,
+    for callers that read the aggregates afterwards.
+    """
+    cached = count_posts(conn, brand, (datetime.now() - dt.timedelta(days=30)).date(), datetime.now().date())
+    if cached < limit_per_sub:
+        download_post_data(conn, reddit, brand, limit_per_sub)
+
+
+def download_post_data(conn, reddit, brand, limit_per_sub) -> List[PostCache]:
+    """Fetch, score and cache the posts of the subreddit that are not cached yet.
+
+    The first fetch takes the top posts of the last month, later ones only the
+    posts created after the stored high-water mark. Posts are listed before
+    their comments are pulled, so cached posts cost neither comment requests
+    nor scoring.
+    """
+    high_water_mark = get_high_water_mark(conn, brand)
+    try:
+        if high_water_mark is None:
+            submissions = list(reddit.subreddit(brand).top(time_filter="month", limit=limit_per_sub))
+        else:
+            submissions = list_new_posts(reddit, brand, high_water_mark, limit=limit_per_sub)
+        # posts are only fetched again to overwrite their sentiment
+        cached_ids = set() if UPDATE_SENTIMENT else get_cached_post_ids(conn, [post.id for post in submissions])
+        new_submissions = [post for post in submissions if post.id not in cached_ids]
+        print("Listed %d posts for %s, %d not cached" % (len(submissions), brand, len(new_submissions)))
+        posts_df, comments_df = submissions_to_frames(reddit, brand, new_submissions)
+    except Exception as e:
+        print("Error fetching reddit data for %s: %s" % (brand, e))
+        return []
+
+    new_posts = score_posts(brand, posts_df, comments_df)
+    if insert_post_cache_bulk(conn, new_posts, update_sentiment=UPDATE_SENTIMENT) and submissions:
+        newest = max(post.created_utc for post in submissions)
+        set_high_water_mark(conn, brand, datetime.fromtimestamp(newest, dt.timezone.utc))
+    return new_posts
+
+
+def score_posts(brand, posts_df, comments_df) -> List[PostCache]:
+    # If there are no posts returned, bail out
+    if posts_df is None or posts_df.empty:
+        return []
+
+    # Iterate over fetched posts and attach comment sentiments
+    new_posts = []
+    for _, row in posts_df.iterrows():
+        date = datetime.fromtimestamp(row.get("created_utc"))
+        # if cutoff is None or date > cutoff:
+        #     continue
+        comments_for_post = comments_df[comments_df["post_id"] == row["id"]] if not comments_df.empty else pd.DataFrame()
+        title = (str(row.get("title", "")) + " " + str(row.get("content", ""))).strip()
+        title_sentiment = get_sentiment([title])[0]
+        comment_texts = comments_for_post["content"].tolist() if not comments_for_post.empty else []
+        comment_sentiments = get_sentiment(comment_texts)
+        avg_comment_sentiment = np.mean(comment_sentiments) if comment_sentiments else 0.0
+        combined_sentiment = np.mean([title_sentiment, avg_comment_sentiment])
+        try:
+            post_cache = PostCache(
+                post_id=row["id"],
+                query=brand,
+                subreddit=row.get("subreddit", "all"),
+                datetime=datetime.fromtimestamp(row.get("created_utc")),
+                title_sentiment=title_sentiment,
+                avg_comment_sentiment=avg_comment_sentiment,
+                avg_sentiment=combined_sentiment
+            )
+        except Exception as e:
+            print(f"Error creating PostCache for post_id {row['id']}: {e}")
+            continue
+        new_posts.append(post_cache)
+    return new_posts
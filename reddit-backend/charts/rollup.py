@@ -0,0 +1,77 @@
+"""Chart data from the daily sentiment rollup (reddit_daily_sentiment)."""
+
+# yt-backend/src/charts/rollup.py and reddit-backend/charts/rollup.py are the
+# same file: each backend is built into its own image and cannot import the
+# other, so change both together.
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.colors import DEFAULT_PLOTLY_COLORS
+from scipy.stats import gaussian_kde
+
+# must match sentiment_bucket() in init.sql
+BUCKETS = 20
+BUCKET_WIDTH = 2 / BUCKETS
+BUCKET_CENTERS = -1 + BUCKET_WIDTH * (np.arange(BUCKETS) + 0.5)
+
+
+def bucket_counts(rollup: pd.DataFrame) -> dict[str, np.ndarray]:
+    counts = {}
+    for query, group in rollup.groupby("query"):
+        per_bucket = group.groupby("bucket")["sentiment_count"].sum()
+        counts[query] = per_bucket.reindex(range(BUCKETS), fill_value=0).to_numpy()
+    return counts
+
+
+def period_mean(rollup: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """Mean sentiment per query and period ("D" for days, "M" for months)."""
+    periods = pd.to_datetime(rollup["day"]).dt.to_period(freq).dt.to_timestamp()
+    grouped = (
+        rollup.assign(period=periods)
+        .groupby(["query", "period"])[["sentiment_count", "sentiment_sum"]]
+        .sum()
+        .reset_index()
+    )
+    grouped["avg_sentiment"] = grouped["sentiment_sum"] / grouped["sentiment_count"]
+    return grouped.sort_values(by="period")
+
+
+def distribution_traces(counts: dict[str, np.ndarray]) -> list:
+    # a histogram + kde pair in the style of ff.create_distplot. The rollup only
+    # keeps the bucket counts, so the kde is fitted to the 20 bucket centers
+    # weighted by their counts: an approximation of the kde of the raw scores
+    # that distplot drew, close but not identical
+    x = np.linspace(-1, 1, 500)
+    traces = []
+    for i, (brand, brand_counts) in enumerate(counts.items()):
+        total = brand_counts.sum()
+        if total == 0:
+            continue
+        color = DEFAULT_PLOTLY_COLORS[i % len(DEFAULT_PLOTLY_COLORS)]
+        traces.append(
+            go.Bar(
+                x=BUCKET_CENTERS,
+                y=brand_counts / (total * BUCKET_WIDTH),
+                width=BUCKET_WIDTH,
+                name=brand,
+                legendgroup=brand,
+                marker_color=color,
+                opacity=0.7,
+            )
+        )
+        if np.count_nonzero(brand_counts) < 2:
+            continue  # everything fell into one bucket, there is no curve to draw
+        kde = gaussian_kde(BUCKET_CENTERS, weights=brand_counts)
+        traces.append(
+            go.Scatter(
+                x=x,
+                y=kde(x),
+                mode="lines",
+                name=brand,
+                legendgroup=brand,
+                showlegend=False,
+                marker_color=color,
+            )
+        )
+    return traces
@@ -1,12 +1,24 @@
+import os
 import psycopg2
-from models import PostCache
-from datetime import datetime
+from psycopg2.extras import execute_values
+from models import IngestionJob, PostCache
+from datetime import date, datetime
+from typing import Optional
+import pandas as pd
+
+# months of posts kept in reddit_cache, older partitions are dropped (0 keeps everything)
+CACHE_RETENTION_MONTHS = int(os.environ.get("CACHE_RETENTION_MONTHS", 24))
+# days finished ingestion jobs are kept for the status endpoint
+JOB_RETENTION_DAYS = int(os.environ.get("INGEST_JOB_RETENTION_DAYS", 7))
+JOB_COLUMNS = ["id", "source", "brand", "status", "attempts", "error", "created_at", "started_at", "finished_at"]
 
 def search_post_database(conn: psycopg2, query: str, startdate: datetime, enddate: datetime) -> list[PostCache]:
     try:
         with conn.cursor() as cur:
+            # not on the chart path, the charts read reddit_daily_sentiment
             cur.execute("""
-                SELECT * FROM reddit_cache
+                SELECT post_id, query, subreddit, datetime, avg_sentiment
+                FROM reddit_cache
                 WHERE query = %s
                 AND datetime >= %s
                 AND datetime <= %s
@@ -18,13 +30,48 @@ def search_post_database(conn: psycopg2, query: str, startdate: datetime, enddat
         return [] 
     return [PostCache(**dict(zip(columns, row))) for row in rows]
     
+def count_posts(conn: psycopg2, query: str, startdate: date, enddate: date) -> int:
+    """Number of cached posts of a query in a range of days, read from the rollup."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT COALESCE(SUM(sentiment_count), 0) FROM reddit_daily_sentiment
+                WHERE query = %s
+                AND day >= %s
+                AND day <= %s
+            """, (query, startdate, enddate))
+            return cur.fetchone()[0]
+    except Exception as e:
+        conn.rollback()
+        print(f"Error counting posts in post database: {e}")
+        return 0
+
+def get_daily_sentiment(conn: psycopg2, queries: list[str], startdate: date, enddate: date) -> pd.DataFrame:
+    """Per query, day and sentiment bucket aggregates from the rollup table."""
+    columns = ["query", "day", "bucket", "sentiment_count", "sentiment_sum", "sentiment_sum_sq"]
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT {", ".join(columns)} FROM reddit_daily_sentiment
+                WHERE query = ANY(%s)
+                AND day >= %s
+                AND day <= %s
+                AND sentiment_count > 0
+            """, (list(queries), startdate, enddate))
+            rows = cur.fetchall()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error querying daily sentiment: {e}")
+        rows = []
+    return pd.DataFrame(rows, columns=columns)
+
 def insert_post_cache(conn: psycopg2, post_cache: list[PostCache]):
     with conn.cursor() as cur:
         try:
             cur.execute("""
                 INSERT INTO reddit_cache (post_id, query, subreddit, datetime, title_sentiment, avg_comment_sentiment)
                 VALUES (%s, %s, %s, %s, %s, %s)
-                ON CONFLICT (post_id) DO NOTHING
+                ON CONFLICT (post_id, datetime) DO NOTHING
             """, (
                 post_cache.post_id,
                 post_cache.query,
@@ -37,3 +84,201 @@ def insert_post_cache(conn: psycopg2, post_cache: list[PostCache]):
             print(f"Error inserting video cache for post_id {post_cache.post_id}: {e}")
     conn.commit()
     return
+
+
+def insert_post_cache_bulk(conn: psycopg2, posts: list[PostCache], update_sentiment: bool = False):
+    """Insert many posts in one statement and one transaction.
+
+    With update_sentiment, posts that are already cached get their sentiment
+    columns overwritten (e.g. after rescoring with a newer model). Returns
+    whether the posts were stored.
+    """
+    if not posts:
+        return True
+    # a row can only be updated once per statement, keep the last version of each post
+    unique_posts = {post.post_id: post for post in posts}
+    rows = [
+        (
+            post.post_id,
+            post.query,
+            post.subreddit,
+            post.datetime,
+            post.title_sentiment,
+            post.avg_comment_sentiment
+        )
+        for post in unique_posts.values()
+    ]
+    if update_sentiment:
+        on_conflict = """DO UPDATE SET
+                    title_sentiment = EXCLUDED.title_sentiment,
+                    avg_comment_sentiment = EXCLUDED.avg_comment_sentiment"""
+    else:
+        on_conflict = "DO NOTHING"
+    try:
+        with conn.cursor() as cur:
+            execute_values(cur, f"""
+                INSERT INTO reddit_cache (post_id, query, subreddit, datetime, title_sentiment, avg_comment_sentiment)
+                VALUES %s
+                ON CONFLICT (post_id, datetime) {on_conflict}
+            """, rows, page_size=len(rows))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error inserting {len(rows)} posts into post cache: {e}")
+        return False
+    return True
+
+
+def get_cached_post_ids(conn: psycopg2, post_ids: list[str]) -> set[str]:
+    """The subset of post_ids that is already in reddit_cache."""
+    if not post_ids:
+        return set()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT post_id FROM reddit_cache WHERE post_id = ANY(%s)", (list(post_ids),))
+            return {row[0] for row in cur.fetchall()}
+    except Exception as e:
+        conn.rollback()
+        print(f"Error querying cached post ids: {e}")
+        return set()
+
+
+def get_high_water_mark(conn: psycopg2, subreddit: str) -> Optional[datetime]:
+    """Creation time of the newest post ingested from the subreddit, if any."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT high_water_mark FROM reddit_fetch_state WHERE subreddit = %s", (subreddit,))
+            row = cur.fetchone()
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error querying high-water mark of {subreddit}: {e}")
+        return None
+    return row[0] if row else None
+
+
+def set_high_water_mark(conn: psycopg2, subreddit: str, high_water_mark: datetime):
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO reddit_fetch_state (subreddit, high_water_mark) VALUES (%s, %s)
+                ON CONFLICT (subreddit) DO UPDATE SET
+                    high_water_mark = GREATEST(reddit_fetch_state.high_water_mark, EXCLUDED.high_water_mark),
+                    fetched_at = EXCLUDED.fetched_at
+            """, (subreddit, high_water_mark))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error storing high-water mark of {subreddit}: {e}")
+
+
+def maintain_partitions(conn: psycopg2):
+    """Create the upcoming monthly partitions of reddit_cache and drop expired ones."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT maintain_cache_partitions('reddit_cache', 'reddit_daily_sentiment', %s)",
+                (CACHE_RETENTION_MONTHS,)
+            )
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error maintaining post cache partitions: {e}")
+
+
+def enqueue_job(conn: psycopg2, source: str, brand: str, fresh_after: datetime) -> Optional[IngestionJob]:
+    """Queue the brand unless it is pending or was ingested after fresh_after, returns its latest job."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO ingestion_jobs (source, brand)
+                SELECT %(source)s, %(brand)s
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM ingestion_jobs
+                    WHERE source = %(source)s AND brand = %(brand)s AND status = 'done' AND finished_at >= %(fresh_after)s
+                )
+                ON CONFLICT DO NOTHING
+            """, {"source": source, "brand": brand, "fresh_after": fresh_after})
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error queueing ingestion of {brand}: {e}")
+        return None
+    return get_latest_job(conn, source, brand)
+
+
+def get_latest_job(conn: psycopg2, source: str, brand: str) -> Optional[IngestionJob]:
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT {", ".join(JOB_COLUMNS)} FROM ingestion_jobs
+                WHERE source = %s AND brand = %s
+                ORDER BY created_at DESC
+                LIMIT 1
+            """, (source, brand))
+            row = cur.fetchone()
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error querying ingestion job of {brand}: {e}")
+        return None
+    return IngestionJob(**dict(zip(JOB_COLUMNS, row))) if row else None
+
+
+def claim_job(conn: psycopg2, source: str, timeout: float) -> Optional[IngestionJob]:
+    """Take the oldest queued job, or one whose worker has been gone for timeout seconds."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                UPDATE ingestion_jobs SET status = 'running', started_at = now(), attempts = attempts + 1
+                WHERE id = (
+                    SELECT id FROM ingestion_jobs
+                    WHERE source = %s
+                    AND (status = 'queued' OR (status = 'running' AND started_at < now() - make_interval(secs => %s)))
+                    ORDER BY created_at
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING {", ".join(JOB_COLUMNS)}
+            """, (source, timeout))
+            row = cur.fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return IngestionJob(**dict(zip(JOB_COLUMNS, row))) if row else None
+
+
+def finish_job(conn: psycopg2, job_id: int, status: str, error: Optional[str] = None):
+    with conn.cursor() as cur:
+        cur.execute(
+            "UPDATE ingestion_jobs SET status = %s, error = %s, finished_at = now() WHERE id = %s",
+            (status, error, job_id)
+        )
+    conn.commit()
+
+
+def retry_job(conn: psycopg2, job_id: int, error: str):
+    with conn.cursor() as cur:
+        cur.execute("UPDATE ingestion_jobs SET status = 'queued', error = %s WHERE id = %s", (error, job_id))
+    conn.commit()
+
+
+def release_job(conn: psycopg2, job_id: int):
+    """Queue a job again without counting the attempt, its worker is shutting down."""
+    with conn.cursor() as cur:
+        cur.execute("UPDATE ingestion_jobs SET status = 'queued', attempts = attempts - 1 WHERE id = %s", (job_id,))
+    conn.commit()
+
+
+def purge_jobs(conn: psycopg2):
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "DELETE FROM ingestion_jobs WHERE finished_at < now() - make_interval(days => %s)",
+                (JOB_RETENTION_DAYS,)
+            )
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error purging ingestion jobs: {e}")
@@ -0,0 +1,162 @@
+"""Thread-safe Postgres connection pool for the sync endpoints.
+
+FastAPI runs sync endpoints in a threadpool, so connections are handed out
+from a ThreadedConnectionPool. Checkouts wait for a free connection instead of
+failing when the pool is exhausted, connections that went bad are replaced,
+and every checkout is counted so the pool can be sized from real numbers.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool
+from pydantic import BaseModel
+
+DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 1))
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 10))
+# seconds a request waits for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 5000))
+# connections idle for longer than this are pinged before they are handed out
+DB_HEALTHCHECK_IDLE = float(os.environ.get("DB_HEALTHCHECK_IDLE", 30))
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class PoolStats(BaseModel):
+    size: int
+    in_use: int
+    max_in_use: int
+    checkouts: int
+    timeouts: int
+    replaced: int
+    avg_wait_ms: float
+    max_wait_ms: float
+    avg_hold_ms: float
+    max_hold_ms: float
+
+
+class ConnectionPool:
+
+    def __init__(self, minconn: int = DB_POOL_MIN_SIZE, maxconn: int = DB_POOL_MAX_SIZE, timeout: float = DB_POOL_TIMEOUT):
+        self.pool = ThreadedConnectionPool(
+            minconn,
+            maxconn,
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            host=os.getenv("DB_HOST"),
+            port=os.getenv("DB_PORT"),
+            database=os.getenv("DB_NAME"),
+            options=f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}",
+        )
+        self.size = maxconn
+        self.timeout = timeout
+        # ThreadedConnectionPool raises as soon as it is exhausted, the semaphore makes callers wait instead
+        self.slots = threading.BoundedSemaphore(maxconn)
+        self.last_used = {}
+
+        self.lock = threading.Lock()
+        self.in_use = 0
+        self.max_in_use = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.replaced = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_hold = 0.0
+        self.max_hold = 0.0
+
+    def is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - self.last_used.get(id(conn), 0) < DB_HEALTHCHECK_IDLE:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        started = time.monotonic()
+        if not self.slots.acquire(timeout=self.timeout):
+            with self.lock:
+                self.timeouts += 1
+            raise PoolTimeoutError(f"No database connection available after {self.timeout}s")
+        try:
+            conn = self.pool.getconn()
+            while not self.is_healthy(conn):
+                self.discard(conn)
+                conn = self.pool.getconn()
+        except Exception:
+            self.slots.release()
+            raise
+
+        wait = time.monotonic() - started
+        with self.lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        return conn
+
+    def putconn(self, conn, held: float = 0.0):
+        try:
+            if conn.closed or conn.get_transaction_status() == extensions.TRANSACTION_STATUS_UNKNOWN:
+                self.discard(conn)
+            else:
+                # never hand an open transaction to the next request
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                self.last_used[id(conn)] = time.monotonic()
+                self.pool.putconn(conn)
+        except psycopg2.Error:
+            self.discard(conn)
+        finally:
+            self.slots.release()
+            with self.lock:
+                self.in_use -= 1
+                self.total_hold += held
+                self.max_hold = max(self.max_hold, held)
+
+    def discard(self, conn):
+        self.last_used.pop(id(conn), None)
+        self.pool.putconn(conn, close=True)
+        with self.lock:
+            self.replaced += 1
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        started = time.monotonic()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn, time.monotonic() - started)
+
+    def stats(self) -> PoolStats:
+        with self.lock:
+            checkouts = max(self.checkouts, 1)
+            return PoolStats(
+                size=self.size,
+                in_use=self.in_use,
+                max_in_use=self.max_in_use,
+                checkouts=self.checkouts,
+                timeouts=self.timeouts,
+                replaced=self.replaced,
+                avg_wait_ms=1000 * self.total_wait / checkouts,
+                max_wait_ms=1000 * self.max_wait,
+                avg_hold_ms=1000 * self.total_hold / checkouts,
+                max_hold_ms=1000 * self.max_hold,
+            )
+
+    def close(self):
+        self.pool.closeall()
@@ -7,6 +7,18 @@ class Chart(BaseModel):
     title: Optional[str]
     plotly_json: str
 
+# Model for the background ingestion of a brand (ingestion_jobs)
+class IngestionJob(BaseModel):
+    id: int
+    source: str
+    brand: str
+    status: str  # queued, running, done or failed
+    attempts: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 # Models for ML service
 class Team(BaseModel):
     brand: Optional[str] = None
@@ -25,6 +37,7 @@ class PostCache(BaseModel):
     query: str
     subreddit: str
     datetime: datetime
-    title_sentiment: float
-    avg_comment_sentiment: float
+    # not read back by search_post_database
+    title_sentiment: Optional[float] = None
+    avg_comment_sentiment: Optional[float] = None
     avg_sentiment: Optional[float] = None
\ No newline at end of file
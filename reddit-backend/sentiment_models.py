@@ -7,6 +7,8 @@ from transformers import pipeline
 # Initialize sentiment analyzers
 vader_analyzer = SentimentIntensityAnalyzer()
 bertweet_pipeline = None  # Lazy load
+# chunks per forward pass, long texts would otherwise pad one huge batch
+BERTWEET_BATCH_SIZE = 32
 
 def clean_text(text):
     """Clean text for sentiment analysis"""
@@ -42,8 +44,9 @@ def get_sentiment_bertweet(text: str, chunk_size=128) -> dict:
     chunks = [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
     score_by_label = {'POS': 0.0, 'NEG': 0.0, 'NEU': 0.0}
     
-    for chunk in chunks:
-        result = bertweet_pipeline(chunk, top_k=None)
+    # batched forward passes instead of one per chunk
+    results = bertweet_pipeline(chunks, top_k=None, batch_size=min(len(chunks), BERTWEET_BATCH_SIZE))
+    for result in results:
         for sentiment in result:
             if sentiment['label'] in score_by_label:
                 score_by_label[sentiment['label']] += sentiment['score']
@@ -0,0 +1,109 @@
+"""Background ingestion of the brands queued in ingestion_jobs.
+
+The chart endpoints only queue a brand and draw whatever is cached, the Reddit
+fetches run in these threads. Workers claim jobs with FOR UPDATE SKIP LOCKED,
+so any number of them, in any number of processes, can share the queue.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from charts.context import get_reddit
+from charts.reddit_access import ensure_post_data
+from db import claim_job, enqueue_job, finish_job, release_job, retry_job
+from db_pool import ConnectionPool
+from models import IngestionJob
+
+SOURCE = "reddit"
+POSTS_PER_BRAND = 100
+# brands ingested at once, their comment fetches share the thread pool of charts.ingestion
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", 2))
+INGEST_POLL_INTERVAL = float(os.environ.get("INGEST_POLL_INTERVAL_SECONDS", 2))
+# a job running for longer than this is assumed to have lost its worker
+INGEST_JOB_TIMEOUT = float(os.environ.get("INGEST_JOB_TIMEOUT_MINUTES", 30)) * 60
+INGEST_MAX_ATTEMPTS = int(os.environ.get("INGEST_MAX_ATTEMPTS", 3))
+# charts queue a brand again once its last ingestion is older than this
+INGEST_FRESHNESS = timedelta(hours=float(os.environ.get("INGEST_FRESHNESS_HOURS", 1)))
+# how long the shutdown waits for the running jobs before closing the pool
+INGEST_SHUTDOWN_TIMEOUT = float(os.environ.get("INGEST_SHUTDOWN_TIMEOUT_SECONDS", 10))
+
+stopping = threading.Event()
+
+
+def queue_brand(conn, brand: str, force: bool = False) -> Optional[IngestionJob]:
+    fresh_after = datetime.now(timezone.utc)
+    if not force:
+        fresh_after -= INGEST_FRESHNESS
+    return enqueue_job(conn, SOURCE, brand, fresh_after)
+
+
+def run_job(conn, job: IngestionJob):
+    if stopping.is_set():
+        # claimed while shutting down, leave the job to the next worker
+        release_job(conn, job.id)
+        return
+    if job.attempts > INGEST_MAX_ATTEMPTS:
+        # claimed again after its worker died on the last attempt
+        finish_job(conn, job.id, "failed", job.error or "Worker lost")
+        return
+    try:
+        reddit = get_reddit()
+        if reddit is None:
+            raise ValueError("Reddit credentials not configured")
+        ensure_post_data(conn, reddit, job.brand, POSTS_PER_BRAND)
+    except Exception as e:
+        conn.rollback()
+        if stopping.is_set():
+            # most likely cut off by the shutdown, the attempt does not count
+            print(f"Releasing {job.brand} after an error while shutting down: {e}")
+            release_job(conn, job.id)
+            return
+        print(f"Error ingesting {job.brand} (attempt {job.attempts}): {e}")
+        if job.attempts < INGEST_MAX_ATTEMPTS:
+            retry_job(conn, job.id, str(e))
+        else:
+            finish_job(conn, job.id, "failed", str(e))
+        return
+    finish_job(conn, job.id, "done")
+
+
+def run_ingestion_worker(db_pool: ConnectionPool):
+    while not stopping.is_set():
+        try:
+            with db_pool.connection() as conn:
+                job = claim_job(conn, SOURCE, INGEST_JOB_TIMEOUT)
+                if job is not None:
+                    print(f"Ingesting {job.brand} (job {job.id})")
+                    run_job(conn, job)
+        except Exception as e:
+            print(f"Error in ingestion worker: {e}")
+            job = None
+        if job is None:
+            stopping.wait(INGEST_POLL_INTERVAL)
+
+
+def start_ingestion_workers(db_pool: ConnectionPool) -> list[threading.Thread]:
+    stopping.clear()
+    workers = [
+        threading.Thread(target=run_ingestion_worker, args=(db_pool,), name=f"ingestion-{i}", daemon=True)
+        for i in range(INGEST_WORKERS)
+    ]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def stop_ingestion_workers(workers: list[threading.Thread]):
+    """Let the workers finish or release their jobs before the pool is closed.
+
+    A job still running after INGEST_SHUTDOWN_TIMEOUT is claimed again after
+    INGEST_JOB_TIMEOUT.
+    """
+    stopping.set()
+    deadline = time.monotonic() + INGEST_SHUTDOWN_TIMEOUT
+    for worker in workers:
+        worker.join(max(0.0, deadline - time.monotonic()))
+        if worker.is_alive():
+            print(f"{worker.name} is still running a job, leaving it behind")
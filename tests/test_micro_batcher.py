@@ -0,0 +1,105 @@
+"""MicroBatcher (ml/batching.py) with a fake model.
+
+    python -m pytest tests/test_micro_batcher.py
+"""
+
+import asyncio
+import pathlib
+import sys
+
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "ml"))
+
+from batching import MicroBatcher  # noqa: E402
+
+
+class FakeModel:
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, texts: list[str]) -> list[float]:
+        self.batches.append(list(texts))
+        return [float(len(text)) for text in texts]
+
+
+def run_with_batcher(model, main, **kwargs):
+    async def runner():
+        batcher = MicroBatcher(model, asyncio.get_running_loop(), **kwargs)
+        try:
+            return await main(batcher)
+        finally:
+            batcher.close()
+
+    return asyncio.run(runner())
+
+
+def test_concurrent_requests_share_a_batch_and_get_their_own_scores():
+    model = FakeModel()
+
+    async def main(batcher):
+        return await asyncio.gather(
+            batcher.submit(["aaa", "b"]), batcher.submit(["cc"]), batcher.submit([])
+        )
+
+    results = run_with_batcher(model, main, max_wait_ms=20)
+
+    assert results == [[3.0, 1.0], [2.0], []]
+    # one forward pass, shortest texts first
+    assert model.batches == [["b", "cc", "aaa"]]
+
+
+def test_batches_are_capped_and_bucketed_by_length():
+    model = FakeModel()
+    texts = ["x" * n for n in (5, 1, 4, 2, 3)]
+
+    async def main(batcher):
+        return await batcher.submit(texts)
+
+    assert run_with_batcher(model, main, max_batch_size=2) == [5.0, 1.0, 4.0, 2.0, 3.0]
+    assert [[len(text) for text in batch] for batch in model.batches] == [
+        [1, 2],
+        [3, 4],
+        [5],
+    ]
+
+
+def test_model_errors_reach_every_waiting_request():
+    def broken(texts):
+        raise RuntimeError("out of memory")
+
+    async def main(batcher):
+        return await asyncio.gather(
+            batcher.submit(["a"]), batcher.submit(["b"]), return_exceptions=True
+        )
+
+    results = run_with_batcher(broken, main, max_wait_ms=20)
+
+    assert [str(result) for result in results] == ["out of memory"] * 2
+
+
+def test_a_failed_batch_does_not_stop_the_batcher():
+    calls = 0
+
+    def flaky(texts):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("first batch fails")
+        return [1.0] * len(texts)
+
+    async def main(batcher):
+        with pytest.raises(RuntimeError):
+            await batcher.submit(["a"])
+        return await batcher.submit(["b"])
+
+    assert run_with_batcher(flaky, main) == [1.0]
+
+
+def test_submit_threadsafe_from_another_thread():
+    model = FakeModel()
+
+    async def main(batcher):
+        return await asyncio.to_thread(batcher.submit_threadsafe, ["abcd"])
+
+    assert run_with_batcher(model, main) == [4.0]
@@ -0,0 +1,98 @@
+"""maintain_cache_partitions (init.sql) against a real Postgres.
+
+Loads init.sql into a scratch schema, like benchmarks/cache_lookups.py, and is
+skipped when no database is reachable:
+
+    DB_HOST=localhost DB_USER=postgres DB_NAME=data python -m pytest tests
+"""
+
+import os
+import pathlib
+from datetime import date
+
+import psycopg2
+import pytest
+
+INIT_SQL = pathlib.Path(__file__).resolve().parent.parent / "init.sql"
+SCHEMA = "partition_maintenance_test"
+
+CACHES = {
+    "youtube_cache": ("youtube_daily_sentiment", "video_id"),
+    "reddit_cache": ("reddit_daily_sentiment", "post_id"),
+}
+
+
+@pytest.fixture
+def cur():
+    try:
+        conn = psycopg2.connect(
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            host=os.getenv("DB_HOST"),
+            port=os.getenv("DB_PORT"),
+            database=os.getenv("DB_NAME"),
+        )
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"No database: {e}")
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {SCHEMA}")
+        cur.execute(f"SET search_path TO {SCHEMA}")
+        cur.execute(INIT_SQL.read_text())
+        yield cur
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    conn.close()
+
+
+def insert(cur, table: str, key: str, age: str):
+    if table == "youtube_cache":
+        cur.execute(
+            "INSERT INTO youtube_cache (video_id, query, datetime, avg_comment_sentiment, title_sentiment)"
+            " VALUES (%s, 'brand', now() - %s::interval, 0.5, 0.5)",
+            (key, age),
+        )
+    else:
+        cur.execute(
+            "INSERT INTO reddit_cache (post_id, query, subreddit, datetime, avg_comment_sentiment, title_sentiment)"
+            " VALUES (%s, 'brand', 'brand', now() - %s::interval, 0.5, 0.5)",
+            (key, age),
+        )
+
+
+def keys(cur, table: str, column: str) -> set[str]:
+    cur.execute(f"SELECT {column} FROM {table} WHERE query = 'brand'")
+    return {row[0] for row in cur.fetchall()}
+
+
+@pytest.mark.parametrize("table", CACHES)
+def test_current_rows_survive_maintenance(cur, table):
+    rollup, column = CACHES[table]
+    insert(cur, table, "now", "0 days")
+    insert(cur, table, "last_month", "1 month")
+
+    for _ in range(2):
+        cur.execute("SELECT maintain_cache_partitions(%s, %s, 24)", (table, rollup))
+
+    assert keys(cur, table, column) == {"now", "last_month"}
+    cur.execute(f"SELECT sum(sentiment_count) FROM {rollup} WHERE query = 'brand'")
+    assert cur.fetchone()[0] == 2
+
+
+@pytest.mark.parametrize("table", CACHES)
+def test_expired_partitions_are_dropped(cur, table):
+    rollup, column = CACHES[table]
+    insert(cur, table, "now", "0 days")
+    insert(cur, table, "expired", "12 months")
+
+    cur.execute("SELECT maintain_cache_partitions(%s, %s, 6)", (table, rollup))
+
+    assert keys(cur, table, column) == {"now"}
+    cur.execute(
+        "SELECT count(*) FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid"
+        " WHERE i.inhparent = %s::regclass AND c.relname = %s",
+        (table, f"{table}_" + date.today().strftime("y%Ym%m")),
+    )
+    assert cur.fetchone()[0] == 1
+    cur.execute(f"SELECT sum(sentiment_count) FROM {rollup} WHERE query = 'brand'")
+    assert cur.fetchone()[0] == 1
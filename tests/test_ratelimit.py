@@ -0,0 +1,86 @@
+"""TokenBucket (yt-backend/src/ratelimit.py) on a real event loop.
+
+    python -m pytest tests/test_ratelimit.py
+"""
+
+import asyncio
+import pathlib
+import sys
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "yt-backend" / "src"))
+
+from ratelimit import TokenBucket  # noqa: E402
+
+# timers fire a little late on a loaded machine, never early
+SLACK = 0.05
+
+
+def test_waiters_are_served_in_fifo_order():
+    async def main():
+        bucket = TokenBucket(rate=100, capacity=5)
+        await bucket.acquire(5)
+        served = []
+
+        async def take(name, amount):
+            await bucket.acquire(amount)
+            served.append(name)
+
+        # the small request behind the big one must not overtake it
+        await asyncio.gather(take("big", 4), take("small", 1), take("last", 1))
+        return served
+
+    assert asyncio.run(main()) == ["big", "small", "last"]
+
+
+def test_waiter_is_woken_when_the_tokens_are_there():
+    async def main():
+        bucket = TokenBucket(rate=10, capacity=1)
+        await bucket.acquire()
+
+        wakes = 0
+        wake = bucket.wake
+
+        def counting_wake():
+            nonlocal wakes
+            wakes += 1
+            wake()
+
+        bucket.wake = counting_wake
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await bucket.acquire()
+        return loop.time() - started, wakes
+
+    elapsed, wakes = asyncio.run(main())
+    assert 0.1 - 0.005 <= elapsed < 0.1 + SLACK
+    # a single timer, no polling
+    assert wakes == 1
+
+
+def test_cancelled_waiters_are_skipped():
+    async def main():
+        bucket = TokenBucket(rate=10, capacity=1)
+        await bucket.acquire()
+        loop = asyncio.get_running_loop()
+
+        cancelled = asyncio.create_task(bucket.acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+
+        started = loop.time()
+        await bucket.acquire()
+        return loop.time() - started, bucket.waiters
+
+    elapsed, waiters = asyncio.run(main())
+    # served with the token the cancelled waiter never took
+    assert elapsed < 0.1 + SLACK
+    assert not waiters
+
+
+def test_request_bigger_than_the_bucket_is_capped():
+    async def main():
+        bucket = TokenBucket(rate=1000, capacity=2)
+        await asyncio.wait_for(bucket.acquire(10), timeout=1)
+        return bucket.tokens
+
+    assert asyncio.run(main()) == 0
@@ -0,0 +1,84 @@
+"""SentimentCache.score (ml/cache.py): deduplication, the LRU and the SQLite tier.
+
+    python -m pytest tests/test_sentiment_cache.py
+"""
+
+import pathlib
+import sys
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "ml"))
+
+from cache import SentimentCache  # noqa: E402
+
+
+class CountingScorer:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts: list[str]) -> list[float]:
+        self.calls.append(list(texts))
+        return [float(len(text)) for text in texts]
+
+
+def test_duplicates_are_scored_once():
+    cache = SentimentCache(path=None)
+    score_fn = CountingScorer()
+
+    scores = cache.score("vader", ["good", "bad", "good", "  good "], score_fn)
+
+    # whitespace is normalized, so all three "good" share one key
+    assert scores == [4.0, 3.0, 4.0, 4.0]
+    assert score_fn.calls == [["good", "bad"]]
+
+
+def test_cached_texts_are_not_scored_again():
+    cache = SentimentCache(path=None)
+    score_fn = CountingScorer()
+
+    cache.score("vader", ["good", "bad"], score_fn)
+    assert cache.score("vader", ["bad", "new"], score_fn) == [3.0, 3.0]
+
+    assert score_fn.calls == [["good", "bad"], ["new"]]
+    stats = cache.stats()
+    assert (stats.memory_hits, stats.misses) == (1, 3)
+
+
+def test_methods_are_cached_separately():
+    cache = SentimentCache(path=None)
+    score_fn = CountingScorer()
+
+    cache.score("vader", ["good"], score_fn)
+    cache.score("textblob", ["good"], score_fn)
+
+    assert score_fn.calls == [["good"], ["good"]]
+
+
+def test_lru_evicts_the_least_recently_used():
+    cache = SentimentCache(max_size=2, path=None)
+    score_fn = CountingScorer()
+
+    cache.score("vader", ["a", "b"], score_fn)
+    cache.score("vader", ["a"], score_fn)  # b is now the oldest
+    cache.score("vader", ["c"], score_fn)
+    cache.score("vader", ["a", "b"], score_fn)
+
+    assert score_fn.calls == [["a", "b"], ["c"], ["b"]]
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    path = str(tmp_path / "sentiment.sqlite")
+    score_fn = CountingScorer()
+
+    cache = SentimentCache(path=path)
+    cache.score("vader", ["good", "bad"], score_fn)
+    cache.close()
+
+    restarted = SentimentCache(path=path)
+    assert restarted.score("vader", ["bad", "good", "new"], score_fn) == [3.0, 4.0, 3.0]
+    assert score_fn.calls == [["good", "bad"], ["new"]]
+    assert restarted.stats().disk_hits == 2
+
+    # read back from disk once, then served from memory
+    restarted.score("vader", ["good"], score_fn)
+    assert restarted.stats().memory_hits == 1
+    restarted.close()
@@ -0,0 +1,52 @@
+"""uncovered_gaps (yt-backend/src/services.py), the parts of a range still to search.
+
+    python -m pytest tests/test_uncovered_gaps.py
+"""
+
+import pathlib
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "yt-backend" / "src"))
+
+from services import MIN_GAP, uncovered_gaps  # noqa: E402
+
+START = datetime(2026, 1, 1)
+END = datetime(2026, 1, 31)
+
+
+def day(n: int) -> datetime:
+    return START + timedelta(days=n)
+
+
+def test_nothing_covered_is_one_gap():
+    assert uncovered_gaps(START, END, []) == [(START, END)]
+
+
+def test_fully_covered_has_no_gaps():
+    assert uncovered_gaps(START, END, [(START - timedelta(days=1), END)]) == []
+
+
+def test_gaps_between_and_around_windows():
+    covered = [(day(2), day(5)), (day(10), day(12))]
+    assert uncovered_gaps(START, END, covered) == [
+        (START, day(2)),
+        (day(5), day(10)),
+        (day(12), END),
+    ]
+
+
+def test_overlapping_and_nested_windows():
+    covered = [(day(2), day(8)), (day(4), day(6)), (day(7), day(10))]
+    assert uncovered_gaps(START, END, covered) == [(START, day(2)), (day(10), END)]
+
+
+def test_windows_outside_the_range_are_clipped():
+    covered = [(day(-5), day(3)), (day(20), day(40))]
+    assert uncovered_gaps(START, END, covered) == [(day(3), day(20))]
+
+
+def test_gaps_shorter_than_min_gap_are_dropped():
+    short = MIN_GAP / 2
+    covered = [(START + short, day(10)), (day(10) + short, END - short)]
+    assert uncovered_gaps(START, END, covered) == []
@@ -1,19 +1,28 @@
+import asyncio
+import datetime as dt
 import io
 import os
 
+import asyncpg
 import pandas as pd
-import psycopg2
 from dotenv import load_dotenv
 from fastapi import Depends, FastAPI
 from fastapi.exceptions import HTTPException
 from fastapi.responses import StreamingResponse
-from psycopg2 import pool
 
+from charts.context import load_chart_context
 from charts.hist import hist
-from charts.latest_histogram import histogram_combined, histogram_sentiment
+from charts.latest_histogram import (
+    HISTOGRAM_DAYS,
+    histogram_combined,
+    histogram_sentiment,
+)
 from charts.time_series import time_series_sentiment
 from charts.word_cloud import word_cloud
-from models import Chart
+from db import create_pool, get_latest_job, run_partition_maintenance
+from ml import close_session, start_session
+from models import Chart, IngestionJob
+from worker import SOURCE, queue_brand, start_ingestion_workers
 
 load_dotenv()
 
@@ -22,53 +31,74 @@ ML_URL = os.environ.get("ML_URL")  # todo: env var
 
 api = FastAPI()
 db_pool = None
+maintenance_task = None
+ingestion_tasks = []
 # print(requests.get("http://localhost:10001/docs").json())
 
 
 @api.on_event("startup")
-def startup():
-    global db_pool
-    db_pool = psycopg2.pool.SimpleConnectionPool(
-        1,
-        10,
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        host=os.getenv("DB_HOST"),
-        port=os.getenv("DB_PORT"),
-        database=os.getenv("DB_NAME"),
-    )
+async def startup():
+    global db_pool, maintenance_task, ingestion_tasks
+    db_pool = await create_pool()
+    maintenance_task = asyncio.create_task(run_partition_maintenance(db_pool))
+    ingestion_tasks = start_ingestion_workers(db_pool)
+
+
+@api.on_event("startup")
+async def start_ml_client():
+    await start_session()
 
 
 @api.on_event("shutdown")
-def shutdown():
+async def shutdown():
     global db_pool
+    if maintenance_task:
+        maintenance_task.cancel()
+    for task in ingestion_tasks:
+        task.cancel()
+    # the workers put back the jobs they were running
+    await asyncio.gather(*ingestion_tasks, return_exceptions=True)
     if db_pool:
-        db_pool.closeall()
+        await db_pool.close()
 
 
-def get_db_connection():
-    global db_pool
-    try:
-        conn = db_pool.getconn()
-        yield conn
-    finally:
-        db_pool.putconn(conn)
+@api.on_event("shutdown")
+async def stop_ml_client():
+    await close_session()
+
 
+def get_db_pool() -> asyncpg.Pool:
+    return db_pool
 
-async def get_charts_inner(brands: list[str], conn: psycopg2) -> list[Chart]:
+
+async def get_charts_inner(brands: list[str], pool: asyncpg.Pool) -> list[Chart]:
     charts = []
 
     try:
+        # the videos are fetched in the background, the charts show what is cached
+        await asyncio.gather(
+            *[queue_brand(pool, brand) for brand in dict.fromkeys(brands)]
+        )
+        # every chart is built from the same data, loaded once; building the
+        # figures is cpu work, so it runs off the event loop
+        context = await load_chart_context(brands, pool)
+        histogram, time_series = await asyncio.gather(
+            asyncio.to_thread(
+                histogram_sentiment,
+                context.since(context.end - dt.timedelta(days=HISTOGRAM_DAYS)),
+            ),
+            asyncio.to_thread(time_series_sentiment, context.brands, context.rollup),
+        )
         charts.extend(
             [
                 Chart(
                     title="Sentiment histogram",
-                    plotly_json=await histogram_sentiment(brands, conn),
+                    plotly_json=histogram,
                 ),
                 # Chart(title="Combined histogram", plotly_json=histogram_combined([brand])),
                 Chart(
                     title="Sentiment over time",
-                    plotly_json=await time_series_sentiment(brands, conn),
+                    plotly_json=time_series,
                 ),
                 # Chart(title="Views time series", plotly_json=time_series_views([brand])),
                 # Chart(title="Combined time series", plotly_json=time_series_combined([brand])),
@@ -81,15 +111,32 @@ async def get_charts_inner(brands: list[str], conn: psycopg2) -> list[Chart]:
 
 
 @api.get("/charts")
-async def get_charts(brand: str, conn=Depends(get_db_connection)) -> list[Chart]:
-    return await get_charts_inner([brand], conn)
+async def get_charts(brand: str, pool=Depends(get_db_pool)) -> list[Chart]:
+    return await get_charts_inner([brand], pool)
 
 
 @api.post("/charts/multibrand")
 async def get_charts_multibrand(
-    brands: list[str], conn=Depends(get_db_connection)
+    brands: list[str], pool=Depends(get_db_pool)
 ) -> list[Chart]:
-    return await get_charts_inner(brands, conn)
+    return await get_charts_inner(brands, pool)
+
+
+@api.post("/ingest")
+async def ingest_brand(brand: str, pool=Depends(get_db_pool)) -> IngestionJob:
+    """Queue a fresh fetch of the brand, the charts pick it up once it is done."""
+    job = await queue_brand(pool, brand, force=True)
+    if job is None:
+        raise HTTPException(status_code=500, detail=f"Could not queue {brand}")
+    return job
+
+
+@api.get("/ingest")
+async def get_ingestion_status(brand: str, pool=Depends(get_db_pool)) -> IngestionJob:
+    job = await get_latest_job(pool, SOURCE, brand)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"{brand} was never queued")
+    return job
 
 
 @api.get("/charts/wordcloud")
@@ -0,0 +1,37 @@
+"""Data shared by the chart builders of one request.
+
+The rollup is read once for the union of the ranges of the charts and each
+chart gets its slice of that frame. The videos are fetched by the ingestion
+worker, the charts show what is cached meanwhile.
+"""
+
+import datetime as dt
+from dataclasses import dataclass
+from datetime import date, datetime
+
+import asyncpg
+import pandas as pd
+
+from charts.latest_histogram import HISTOGRAM_DAYS
+from charts.time_series import OLDEST_DATE
+from db import get_daily_sentiment
+
+
+@dataclass
+class ChartContext:
+    brands: list[str]
+    start: date
+    end: date
+    # daily sentiment rollup of the brands from start to end
+    rollup: pd.DataFrame
+
+    def since(self, start: date) -> pd.DataFrame:
+        return self.rollup[self.rollup["day"] >= start]
+
+
+async def load_chart_context(brands: list[str], pool: asyncpg.Pool) -> ChartContext:
+    brands = list(dict.fromkeys(brands))
+    end = datetime.now()
+    start = min(OLDEST_DATE, end - dt.timedelta(days=HISTOGRAM_DAYS)).date()
+    rollup = await get_daily_sentiment(pool, brands, start, end.date())
+    return ChartContext(brands, start, end.date(), rollup)
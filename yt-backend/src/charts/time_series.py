@@ -3,37 +3,35 @@ import datetime as dt
 from dataclasses import dataclass
 from datetime import datetime
 
+import asyncpg
 import pandas as pd
 
 # import plotly.express as px
 import plotly.graph_objects as go
 import plotly.io as pio
-import psycopg2
 from dateutil.relativedelta import relativedelta
 
-from services import get_all_video_data
+from charts.rollup import period_mean
+from services import ensure_video_data
 
 
-async def get_by_start_date(start_date: datetime, brand: str, conn):
+async def get_by_start_date(start_date: datetime, brand: str, pool: asyncpg.Pool):
     end_date = start_date + QUERY_SPAN
-    videos = await get_all_video_data(conn, brand, 5, start_date, end_date)
-    return videos
+    await ensure_video_data(pool, brand, 5, start_date, end_date)
 
 
-async def time_series_sentiment(brands: list[str], conn: psycopg2):
-    brand_videos = {}
-
-    for brand in brands:
-        brand_videos[brand] = []
-
-        tasks = [
-            get_by_start_date(start_date, brand, conn)
+async def ensure_time_series_data(brand: str, pool: asyncpg.Pool):
+    await asyncio.gather(
+        *[
+            get_by_start_date(start_date, brand, pool)
             for start_date in get_download_timerange()
         ]
-        for result in await asyncio.gather(*tasks):
-            brand_videos[brand].extend(result)
+    )
+
 
-    if not any(brand_videos.values()):
+def time_series_sentiment(brands: list[str], rollup: pd.DataFrame):
+    """rollup: the daily sentiment of the brands since OLDEST_DATE."""
+    if rollup.empty:
         fig = go.Figure()
         fig.update_layout(
             title="No data available",
@@ -43,55 +41,17 @@ async def time_series_sentiment(brands: list[str], conn: psycopg2):
         )
         return pio.to_json(fig)
 
-    figures = []
-    for brand in brands:
-        if not brand_videos[brand]:
-            continue
-
-        try:
-            video_df = pd.DataFrame(
-                [
-                    {
-                        "video_id": v.video_id,
-                        "brand": v.query,
-                        "published_at": v.datetime,
-                        "avg_sentiment": v.avg_sentiment or 0.0,
-                    }
-                    for v in brand_videos[brand]
-                ]
-            )
-
-            video_df["published_at"] = pd.to_datetime(
-                video_df["published_at"], errors="coerce"
-            )
-            video_df = video_df.dropna(subset=["published_at"])
-
-            video_df["month"] = video_df["published_at"].dt.to_period("M")
-            monthly_df = video_df.groupby("month")["avg_sentiment"].mean().reset_index()
-            monthly_df["month"] = monthly_df["month"].dt.to_timestamp()
-            monthly_df.sort_values(by="month", inplace=True)
-
-            figures.append(
-                go.Scatter(
-                    x=monthly_df["month"],
-                    y=monthly_df["avg_sentiment"],
-                    name=brand,
-                    connectgaps=True,
-                )
-            )
-        except Exception as e:
-            print(f"Error processing brand {brand}: {e}")
-            continue
-
-    if not figures:
-        fig = go.Figure()
-        fig.update_layout(
-            title="No valid data available",
-            xaxis_title="Month",
-            yaxis_title="Sentiment",
-            template="plotly_white",
+    monthly_df = period_mean(rollup, "M")
+    figures = [
+        go.Scatter(
+            x=monthly_df.loc[monthly_df["query"] == brand, "period"],
+            y=monthly_df.loc[monthly_df["query"] == brand, "avg_sentiment"],
+            name=brand,
+            connectgaps=True,
         )
-        return pio.to_json(fig)
+        for brand in brands
+        if (monthly_df["query"] == brand).any()
+    ]
 
     fig = go.Figure(data=figures)
     fig.update_layout(
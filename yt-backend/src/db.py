@@ -1,44 +1,262 @@
-import psycopg2
-from datetime import datetime
-from models import VideoCache
-
-def search_video_database(conn: psycopg2, query: str, startdate: datetime, enddate: datetime) -> list[VideoCache]:
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT * FROM youtube_cache
-                WHERE query = %s
-                AND datetime >= %s
-                AND datetime <= %s
-            """, (query, startdate, enddate))
-            columns = [desc[0] for desc in cur.description]
-            rows = cur.fetchall()
+import asyncio
+import os
+from datetime import date, datetime, timezone
+from typing import Optional
+
+import asyncpg
+import pandas as pd
+
+from models import IngestionJob, VideoCache
+
+DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 1))
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 10))
+# months of videos kept in youtube_cache, older partitions are dropped (0 keeps everything)
+CACHE_RETENTION_MONTHS = int(os.environ.get("CACHE_RETENTION_MONTHS", 24))
+PARTITION_MAINTENANCE_INTERVAL = float(os.environ.get("PARTITION_MAINTENANCE_INTERVAL_HOURS", 24)) * 3600
+# days finished ingestion jobs are kept for the status endpoint
+JOB_RETENTION_DAYS = int(os.environ.get("INGEST_JOB_RETENTION_DAYS", 7))
+
+# asyncpg prepares each statement once per connection and reuses it afterwards
+# not on the chart path, the charts read youtube_daily_sentiment
+SEARCH_VIDEOS_SQL = """
+    SELECT video_id, query, datetime, views, likes, comments, avg_sentiment, weighted_sentiment
+    FROM youtube_cache
+    WHERE query = $1
+    AND datetime >= $2
+    AND datetime <= $3
+"""
+
+COVERAGE_SQL = """
+    SELECT start_at, end_at FROM youtube_fetch_coverage
+    WHERE query = $1
+    AND fetched_at >= $2
+    AND start_at < $4
+    AND end_at > $3
+    ORDER BY start_at
+"""
+
+RECORD_COVERAGE_SQL = """
+    INSERT INTO youtube_fetch_coverage (query, start_at, end_at) VALUES ($1, $2, $3)
+"""
+
+EXPIRE_COVERAGE_SQL = """
+    DELETE FROM youtube_fetch_coverage WHERE query = $1 AND fetched_at < $2
+"""
+
+DAILY_SENTIMENT_SQL = """
+    SELECT query, day, bucket, sentiment_count, sentiment_sum, sentiment_sum_sq
+    FROM youtube_daily_sentiment
+    WHERE query = ANY($1::text[])
+    AND day >= $2
+    AND day <= $3
+    AND sentiment_count > 0
+"""
+
+MAINTAIN_PARTITIONS_SQL = """
+    SELECT maintain_cache_partitions('youtube_cache', 'youtube_daily_sentiment', $1)
+"""
+
+INSERT_VIDEOS_SQL = """
+    INSERT INTO youtube_cache (video_id, query, datetime, views, likes, comments, avg_comment_sentiment, title_sentiment)
+    SELECT * FROM unnest($1::varchar[], $2::text[], $3::timestamp[], $4::bigint[], $5::bigint[], $6::bigint[], $7::real[], $8::real[])
+    ON CONFLICT (video_id, datetime) DO NOTHING
+"""
+
+JOB_COLUMNS = "id, source, brand, status, attempts, error, created_at, started_at, finished_at"
+
+# a brand is not queued again while a job for it is pending or finished after $3
+ENQUEUE_JOB_SQL = """
+    INSERT INTO ingestion_jobs (source, brand)
+    SELECT $1, $2
+    WHERE NOT EXISTS (
+        SELECT 1 FROM ingestion_jobs
+        WHERE source = $1 AND brand = $2 AND status = 'done' AND finished_at >= $3
+    )
+    ON CONFLICT DO NOTHING
+"""
+
+LATEST_JOB_SQL = f"""
+    SELECT {JOB_COLUMNS} FROM ingestion_jobs
+    WHERE source = $1 AND brand = $2
+    ORDER BY created_at DESC
+    LIMIT 1
+"""
+
+# running jobs that were started more than $2 seconds ago lost their worker
+CLAIM_JOB_SQL = f"""
+    UPDATE ingestion_jobs SET status = 'running', started_at = now(), attempts = attempts + 1
+    WHERE id = (
+        SELECT id FROM ingestion_jobs
+        WHERE source = $1
+        AND (status = 'queued' OR (status = 'running' AND started_at < now() - make_interval(secs => $2)))
+        ORDER BY created_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING {JOB_COLUMNS}
+"""
+
+FINISH_JOB_SQL = """
+    UPDATE ingestion_jobs SET status = $2, error = $3, finished_at = now() WHERE id = $1
+"""
+
+RETRY_JOB_SQL = """
+    UPDATE ingestion_jobs SET status = 'queued', error = $2 WHERE id = $1
+"""
+
+# the worker stopped before finishing, the attempt does not count
+RELEASE_JOB_SQL = """
+    UPDATE ingestion_jobs SET status = 'queued', attempts = attempts - 1 WHERE id = $1
+"""
+
+PURGE_JOBS_SQL = """
+    DELETE FROM ingestion_jobs WHERE finished_at < now() - make_interval(days => $1)
+"""
+
+
+async def create_pool() -> asyncpg.Pool:
+    return await asyncpg.create_pool(
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        database=os.getenv("DB_NAME"),
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+    )
+
+
+def to_db_datetime(value: datetime) -> datetime:
+    # the columns are TIMESTAMP (without time zone) holding utc
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+async def search_video_database(pool: asyncpg.Pool, query: str, startdate: datetime, enddate: datetime) -> list[VideoCache]:
+    try:
+        rows = await pool.fetch(
+            SEARCH_VIDEOS_SQL, query, to_db_datetime(startdate), to_db_datetime(enddate)
+        )
     except Exception as e:
         print(f"Error querying video database: {e}")
-        return [] 
-    return [VideoCache(**dict(zip(columns, row))) for row in rows]
-    
-def insert_video_cache(conn: psycopg2, video_cache: list[VideoCache]):
-    with conn.cursor() as cur:
-        try:
-            cur.execute("""
-                INSERT INTO youtube_cache (video_id, query, datetime, views, likes, comments, avg_comment_sentiment, title_sentiment)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (video_id) DO NOTHING
-            """, (
-                video_cache.video_id,
-                video_cache.query,
-                video_cache.datetime,
-                video_cache.views,
-                video_cache.likes,
-                video_cache.comments,
-                video_cache.avg_comment_sentiment,
-                video_cache.title_sentiment
-            ))
-        except Exception as e:
-            print(f"Error inserting video cache for video_id {video_cache.video_id}: {e}")
-    conn.commit()
-    return
-
-
-    
+        return []
+    return [VideoCache(**dict(row)) for row in rows]
+
+
+async def get_coverage(pool: asyncpg.Pool, query: str, startdate: datetime, enddate: datetime, fresh_after: datetime) -> list[tuple[datetime, datetime]]:
+    """Windows overlapping the range that were searched after fresh_after, by start."""
+    try:
+        rows = await pool.fetch(
+            COVERAGE_SQL, query, to_db_datetime(fresh_after), to_db_datetime(startdate), to_db_datetime(enddate)
+        )
+    except Exception as e:
+        print(f"Error querying fetch coverage: {e}")
+        return []
+    return [(row["start_at"], row["end_at"]) for row in rows]
+
+
+async def record_coverage(pool: asyncpg.Pool, query: str, startdate: datetime, enddate: datetime, expired_before: datetime):
+    try:
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(EXPIRE_COVERAGE_SQL, query, to_db_datetime(expired_before))
+                await conn.execute(RECORD_COVERAGE_SQL, query, to_db_datetime(startdate), to_db_datetime(enddate))
+    except Exception as e:
+        print(f"Error recording fetch coverage: {e}")
+
+
+async def get_daily_sentiment(pool: asyncpg.Pool, queries: list[str], startdate: date, enddate: date) -> pd.DataFrame:
+    """Per query, day and sentiment bucket aggregates from the rollup table."""
+    try:
+        rows = await pool.fetch(DAILY_SENTIMENT_SQL, queries, startdate, enddate)
+    except Exception as e:
+        print(f"Error querying daily sentiment: {e}")
+        rows = []
+    return pd.DataFrame(
+        [dict(row) for row in rows],
+        columns=["query", "day", "bucket", "sentiment_count", "sentiment_sum", "sentiment_sum_sq"],
+    )
+
+
+async def insert_video_cache_bulk(pool: asyncpg.Pool, videos: list[VideoCache]) -> bool:
+    """Insert many videos in one statement and one transaction, False if it failed."""
+    if not videos:
+        return True
+    columns = list(zip(*(
+        (
+            video.video_id,
+            video.query,
+            to_db_datetime(video.datetime),
+            video.views,
+            video.likes,
+            video.comments,
+            video.avg_comment_sentiment,
+            video.title_sentiment,
+        )
+        for video in videos
+    )))
+    try:
+        await pool.execute(INSERT_VIDEOS_SQL, *columns)
+    except Exception as e:
+        print(f"Error inserting {len(videos)} videos into video cache: {e}")
+        return False
+    return True
+
+
+async def maintain_partitions(pool: asyncpg.Pool):
+    """Create the upcoming monthly partitions of youtube_cache and drop expired ones."""
+    try:
+        await pool.execute(MAINTAIN_PARTITIONS_SQL, CACHE_RETENTION_MONTHS)
+    except Exception as e:
+        print(f"Error maintaining video cache partitions: {e}")
+
+
+async def enqueue_job(pool: asyncpg.Pool, source: str, brand: str, fresh_after: datetime) -> Optional[IngestionJob]:
+    """Queue the brand unless it is pending or was ingested after fresh_after, returns its latest job."""
+    try:
+        async with pool.acquire() as conn:
+            await conn.execute(ENQUEUE_JOB_SQL, source, brand, fresh_after)
+            row = await conn.fetchrow(LATEST_JOB_SQL, source, brand)
+    except Exception as e:
+        print(f"Error queueing ingestion of {brand}: {e}")
+        return None
+    return IngestionJob(**dict(row))
+
+
+async def get_latest_job(pool: asyncpg.Pool, source: str, brand: str) -> Optional[IngestionJob]:
+    row = await pool.fetchrow(LATEST_JOB_SQL, source, brand)
+    return IngestionJob(**dict(row)) if row else None
+
+
+async def claim_job(pool: asyncpg.Pool, source: str, timeout: float) -> Optional[IngestionJob]:
+    """Take the oldest queued job, or one whose worker has been gone for timeout seconds."""
+    row = await pool.fetchrow(CLAIM_JOB_SQL, source, timeout)
+    return IngestionJob(**dict(row)) if row else None
+
+
+async def finish_job(pool: asyncpg.Pool, job_id: int, status: str, error: Optional[str] = None):
+    await pool.execute(FINISH_JOB_SQL, job_id, status, error)
+
+
+async def retry_job(pool: asyncpg.Pool, job_id: int, error: str):
+    await pool.execute(RETRY_JOB_SQL, job_id, error)
+
+
+async def release_job(pool: asyncpg.Pool, job_id: int):
+    await pool.execute(RELEASE_JOB_SQL, job_id)
+
+
+async def purge_jobs(pool: asyncpg.Pool):
+    try:
+        await pool.execute(PURGE_JOBS_SQL, JOB_RETENTION_DAYS)
+    except Exception as e:
+        print(f"Error purging ingestion jobs: {e}")
+
+
+async def run_partition_maintenance(pool: asyncpg.Pool):
+    # partitions are only created a few months ahead, so keep doing it while running
+    while True:
+        await maintain_partitions(pool)
+        await purge_jobs(pool)
+        await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL)
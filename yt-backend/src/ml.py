@@ -1,21 +1,76 @@
 import asyncio
 import os
+from typing import Optional
 
 import aiohttp
 
+from models import SentimentQuery, Team
+
 address = os.environ.get("ML_URL", "http://ml:8080/get_sentiment")
+method = os.environ.get("ML_METHOD")  # the ml service default when unset
+
+ML_MAX_CONNECTIONS = int(os.environ.get("ML_MAX_CONNECTIONS", 20))
+ML_KEEPALIVE = float(os.environ.get("ML_KEEPALIVE", 60))
+ML_TIMEOUT = float(os.environ.get("ML_TIMEOUT", 60))
+ML_CONNECT_TIMEOUT = float(os.environ.get("ML_CONNECT_TIMEOUT", 5))
+
+# shared between requests, created on app startup
+session: Optional[aiohttp.ClientSession] = None
+
+
+def create_session() -> aiohttp.ClientSession:
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=ML_MAX_CONNECTIONS, keepalive_timeout=ML_KEEPALIVE
+        ),
+        timeout=aiohttp.ClientTimeout(total=ML_TIMEOUT, connect=ML_CONNECT_TIMEOUT),
+        headers={"Content-Type": "application/json"},
+    )
+
+
+async def start_session():
+    global session
+    if session is None or session.closed:
+        session = create_session()
+
+
+async def close_session():
+    global session
+    if session is not None:
+        await session.close()
+        session = None
+
+
+async def post_query(client: aiohttp.ClientSession, data: dict) -> list[list[float]]:
+    if method is not None:
+        data = {**data, "method": method}
+    async with client.post(address, json=data) as resp:
+        resp.raise_for_status()
+        return (await resp.json())["sentiment"]
+
+
+async def query_sentiment(data: dict) -> list[list[float]]:
+    if session is None:
+        # e.g. scripts running outside the api
+        async with create_session() as temp_session:
+            return await post_query(temp_session, data)
+    return await post_query(session, data)
 
 
 async def get_sentiment(texts: list[str]) -> list[float]:
     data = {"teams": [{"texts": texts}]}
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            address, json=data, headers={"Content-Type": "application/json"}
-        ) as resp:
-            sentiment = (await resp.json())["sentiment"]
+    sentiment = await query_sentiment(data)
     return sentiment[0]
 
 
+async def get_sentiment_teams(teams: list[Team]) -> list[list[float]]:
+    """Score several teams of texts in one request, one list of scores per team."""
+    if not teams:
+        return []
+    data = SentimentQuery(teams=teams).model_dump(exclude_none=True)
+    return await query_sentiment(data)
+
+
 def draft():
     print(asyncio.run(get_sentiment(["i hate nn"])))
 
@@ -1,3 +1,4 @@
+from dataclasses import dataclass
 from datetime import datetime
 from typing import Optional
 
@@ -47,7 +48,7 @@ class SearchQuery(BaseModel):
 
 class CommentThreadRetrieveQuery(BaseModel):
     video_id: str
-    part: tuple[str] = ("snippet",)
+    part: tuple[str, ...] = ("snippet",)
     max_results: int = 100
     order: str = "relevance"
     search_terms: Optional[tuple[str]] = None
@@ -201,12 +202,106 @@ class VideoListResponse(BaseModel):
     items: list[Video]
 
 
+# Lean records for the ingestion pipeline. They keep only the fields the
+# pipeline reads and skip validation; the pydantic models above describe the
+# full responses and are used for them in strict mode (see ytapi).
+@dataclass(slots=True)
+class SearchResult:
+    video_id: str
+    title: str
+    description: str
+    published_at: datetime
+    channel_title: str
+
+    @classmethod
+    def from_api(cls, item: dict) -> "SearchResult":
+        snippet = item["snippet"]
+        return cls(
+            video_id=item["id"]["videoId"],
+            title=snippet["title"],
+            description=snippet["description"],
+            published_at=datetime.fromisoformat(snippet["publishedAt"]),
+            channel_title=snippet["channelTitle"],
+        )
+
+
+@dataclass(slots=True)
+class SearchPage:
+    items: list[SearchResult]
+    next_page_token: Optional[str]
+
+    @classmethod
+    def from_api(cls, response: dict) -> "SearchPage":
+        return cls(
+            items=[SearchResult.from_api(item) for item in response["items"]],
+            next_page_token=response.get("nextPageToken"),
+        )
+
+
+@dataclass(slots=True)
+class CommentRecord:
+    id: str
+    text: str
+    like_count: int
+
+    @classmethod
+    def from_api(cls, comment: dict) -> "CommentRecord":
+        snippet = comment["snippet"]
+        return cls(
+            id=comment["id"],
+            text=snippet["textOriginal"],
+            like_count=snippet.get("likeCount", 0),
+        )
+
+
+@dataclass(slots=True)
+class CommentThreadRecord:
+    comment: CommentRecord
+    replies: list[CommentRecord]
+
+    @classmethod
+    def from_api(cls, thread: dict) -> "CommentThreadRecord":
+        replies = thread.get("replies", {}).get("comments", [])
+        return cls(
+            comment=CommentRecord.from_api(thread["snippet"]["topLevelComment"]),
+            replies=[CommentRecord.from_api(reply) for reply in replies],
+        )
+
+
+@dataclass(slots=True)
+class CommentPage:
+    items: list[CommentThreadRecord]
+    next_page_token: Optional[str]
+
+    @classmethod
+    def from_api(cls, response: dict) -> "CommentPage":
+        return cls(
+            items=[
+                CommentThreadRecord.from_api(thread) for thread in response["items"]
+            ],
+            next_page_token=response.get("nextPageToken"),
+        )
+
+
 # Model for charts
 class Chart(BaseModel):
     title: Optional[str]
     plotly_json: str  # test json string
 
 
+# Model for the background ingestion of a brand (ingestion_jobs)
+class IngestionJob(BaseModel):
+    id: int
+    source: str
+    brand: str
+    status: str  # queued, running, done or failed
+    attempts: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
 # Models for ML service
 class Team(BaseModel):
     brand: Optional[str] = None
@@ -234,7 +329,8 @@ class VideoCache(BaseModel):
     views: Optional[int]
     likes: Optional[int]
     comments: Optional[int]
-    avg_comment_sentiment: Optional[float]
-    title_sentiment: Optional[float]
+    # not read back by search_video_database
+    avg_comment_sentiment: Optional[float] = None
+    title_sentiment: Optional[float] = None
     weighted_sentiment: Optional[float] = None
     avg_sentiment: Optional[float] = None
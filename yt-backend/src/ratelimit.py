@@ -0,0 +1,148 @@
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+# quota units charged per call of each endpoint
+ENDPOINT_COSTS = {
+    "search": 100,
+    "videos": 1,
+    "commentThreads": 1,
+}
+
+REQUESTS_PER_SECOND = float(os.environ.get("YOUTUBE_REQUESTS_PER_SECOND", 100))
+UNITS_PER_SECOND = float(os.environ.get("YOUTUBE_UNITS_PER_SECOND", 3000))
+DAILY_QUOTA = int(os.environ.get("YOUTUBE_DAILY_QUOTA", 10_000))
+# requests in flight at once, over all brands and windows of all requests
+MAX_CONCURRENCY = int(os.environ.get("YOUTUBE_MAX_CONCURRENCY", 64))
+
+# the daily quota resets at midnight pacific time
+QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+
+
+class QuotaExceededError(ValueError):
+    pass
+
+
+class TokenBucket:
+    """Async token bucket.
+
+    Waiters are served in FIFO order and woken by a timer exactly when enough
+    tokens have accumulated for the first one, so nobody polls.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.waiters: deque[tuple[float, asyncio.Future]] = deque()
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        # a request bigger than the bucket would never be served otherwise
+        amount = min(amount, self.capacity)
+
+        self.refill()
+        if not self.waiters and self.tokens >= amount:
+            self.tokens -= amount
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((amount, future))
+        self.schedule()
+        await future
+
+    def wake(self):
+        self.timer = None
+        self.refill()
+        while self.waiters:
+            amount, future = self.waiters[0]
+            if future.done():  # cancelled while waiting
+                self.waiters.popleft()
+                continue
+            if self.tokens < amount:
+                break
+            self.tokens -= amount
+            self.waiters.popleft()
+            future.set_result(None)
+        self.schedule()
+
+    def schedule(self):
+        if self.timer is not None or not self.waiters:
+            return
+        amount, future = self.waiters[0]
+        delay = max(0.0, (amount - self.tokens) / self.rate)
+        self.timer = future.get_loop().call_later(delay, self.wake)
+
+
+class QuotaBudget:
+    """Quota units spent today, so we fail fast instead of collecting 403s."""
+
+    def __init__(self, daily_units: int):
+        self.daily_units = daily_units
+        self.used = 0
+        self.day = self.today()
+
+    @staticmethod
+    def today():
+        return datetime.now(QUOTA_TIMEZONE).date()
+
+    def roll_over(self):
+        today = self.today()
+        if today != self.day:
+            self.day = today
+            self.used = 0
+
+    def remaining(self) -> int:
+        self.roll_over()
+        return max(0, self.daily_units - self.used)
+
+    def spend(self, units: int):
+        if units > self.remaining():
+            raise QuotaExceededError(
+                f"YouTube quota exhausted: {self.used}/{self.daily_units} units used today."
+            )
+        self.used += units
+
+    def exhaust(self):
+        # youtube told us we are out, whatever we counted
+        self.roll_over()
+        self.used = max(self.used, self.daily_units)
+
+
+class YouTubeRateLimiter:
+
+    def __init__(
+        self,
+        requests_per_second: float = REQUESTS_PER_SECOND,
+        units_per_second: float = UNITS_PER_SECOND,
+        daily_quota: int = DAILY_QUOTA,
+        max_concurrency: int = MAX_CONCURRENCY,
+    ):
+        self.requests = TokenBucket(requests_per_second, requests_per_second)
+        self.units = TokenBucket(units_per_second, units_per_second)
+        self.quota = QuotaBudget(daily_quota)
+        self.in_flight = asyncio.Semaphore(max_concurrency)
+
+    async def acquire(self, endpoint: str):
+        cost = ENDPOINT_COSTS.get(endpoint, 1)
+        self.quota.spend(cost)
+        await self.units.acquire(cost)
+        await self.requests.acquire()
+
+    @asynccontextmanager
+    async def request(self, endpoint: str):
+        """Holds one of the concurrency slots until the request is done."""
+        async with self.in_flight:
+            await self.acquire(endpoint)
+            yield
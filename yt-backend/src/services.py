@@ -1,21 +1,44 @@
 import asyncio
 import datetime as dt
+import os
+from dataclasses import dataclass
 from datetime import datetime
 from typing import Optional
 
+import asyncpg
 import pandas as pd
-import psycopg2
 
-from db import insert_video_cache, search_video_database
-from ml import get_sentiment
+from db import (
+    get_coverage,
+    insert_video_cache_bulk,
+    record_coverage,
+    search_video_database,
+    to_db_datetime,
+)
+from ml import get_sentiment_teams
 from models import (
     CommentListResponse,
-    SearchItem,
-    SearchListResponse,
+    SearchPage,
+    SearchResult,
+    Team,
     VideoCache,
     VideoListResponse,
+    VideoStatistics,
+)
+from ratelimit import QuotaExceededError
+from ytapi import (
+    get_video_statistics_async,
+    iter_comments_async,
+    search_videos_async,
 )
-from ytapi import get_comments_async, get_video_details_async, search_videos_async
+
+# how many comments of a video are scored
+COMMENTS_PER_VIDEO = int(os.environ.get("YT_COMMENTS_PER_VIDEO", 50))
+INCLUDE_REPLIES = os.environ.get("YT_INCLUDE_REPLIES", "false").lower() == "true"
+# a searched window is not searched again for this long
+COVERAGE_TTL = dt.timedelta(hours=float(os.environ.get("YT_COVERAGE_TTL_HOURS", 24)))
+# uncovered gaps shorter than this are not worth a search (100 quota units each)
+MIN_GAP = dt.timedelta(hours=float(os.environ.get("YT_MIN_GAP_HOURS", 1)))
 
 
 def get_comment_reply_dict(comment_threads: CommentListResponse):
@@ -32,22 +55,28 @@ def get_comment_reply_dict(comment_threads: CommentListResponse):
     return comment_reply_dict
 
 
-async def video_to_dataframe(videos: SearchListResponse, video_stats=None):
+async def video_to_dataframe(videos: SearchPage, video_stats=None):
+    if video_stats is None:
+        video_stats = await get_video_statistics_async(
+            [item.video_id for item in videos.items]
+        )
+
     video_data = []
     for item in videos.items:
-        video_id = item.id.videoId
-        video_details = await get_video_details_async(video_id)
-        video_stats = get_video_stats(video_details)
+        video_id = item.video_id
+        stats = video_stats.get(video_id)
+        if stats is None:
+            continue
         video_data.append(
             {
                 "video_id": video_id,
-                "title": item.snippet.title,
-                "description": item.snippet.description,
-                "published_at": item.snippet.publishedAt,
-                "channel_title": item.snippet.channelTitle,
-                "like_count": video_stats.likeCount,
-                "view_count": video_stats.viewCount,
-                "comment_count": video_stats.commentCount,
+                "title": item.title,
+                "description": item.description,
+                "published_at": item.published_at,
+                "channel_title": item.channel_title,
+                "like_count": stats.likeCount,
+                "view_count": stats.viewCount,
+                "comment_count": stats.commentCount,
             }
         )
     df = pd.DataFrame(video_data)
@@ -105,98 +134,240 @@ def split_date_range(
     return intervals
 
 
-async def process_video(item: SearchItem, query: str) -> Optional[VideoCache]:
-    video_id = item.id.videoId
+@dataclass
+class FetchedVideo:
+    item: SearchResult
+    stats: VideoStatistics
+    comments: list[str]
+
+
+# error reasons of commentThreads that only mean the video has nothing to score
+SKIPPED_COMMENT_ERRORS = ("commentsDisabled", "videoNotFound")
+
+
+async def fetch_video(
+    item: SearchResult, video_stats: Optional[VideoStatistics]
+) -> Optional[FetchedVideo]:
+    """None if the video has no comments to score; api failures are raised."""
+    video_id = item.video_id
+    if video_stats is None:
+        return None
+    if video_stats.commentCount is None or video_stats.commentCount == 0:
+        return None
     try:
-        video_details = await get_video_details_async(video_id)
-        video_stats = get_video_stats(video_details)
-
-        if video_stats.commentCount is None or video_stats.commentCount == 0:
-            return None
-        comments = await get_comments_async(video_id)
-        top_comments = comments_to_list_of_top_level(comments)
-        comment_count = video_stats.commentCount or 0
-        like_count = video_stats.likeCount or 0
-        comments_sentiments = await get_sentiment(top_comments)
-
-        if not comments_sentiments or len(comments_sentiments) == 0:
-            return None
-
-        avg_comment_sentiment = (
-            sum(comments_sentiments) / len(comments_sentiments)
-            if len(comments_sentiments) != 0
-            else 0
-        )
-        title_sentiment = (await get_sentiment([item.snippet.title]))[0] or 0.0
-        avg_sentiment = (avg_comment_sentiment + title_sentiment) / 2
-        weighted_sentiment = (avg_comment_sentiment * comment_count * 0.988) + (
-            title_sentiment * like_count * 0.012
-        )
-        return VideoCache(
-            video_id=video_id,
-            query=query,
-            datetime=item.snippet.publishedAt,
-            views=video_stats.viewCount or 0,
-            likes=video_stats.likeCount,
-            comments=video_stats.commentCount,
-            avg_comment_sentiment=avg_comment_sentiment,
-            title_sentiment=title_sentiment,
-            avg_sentiment=avg_sentiment,
-            weighted_sentiment=weighted_sentiment,
+        comments = [
+            comment.text
+            async for comment in iter_comments_async(
+                video_id,
+                max_comments=COMMENTS_PER_VIDEO,
+                include_replies=INCLUDE_REPLIES,
+            )
+        ]
+    except QuotaExceededError:
+        raise
+    except ValueError as e:
+        if not any(reason in str(e) for reason in SKIPPED_COMMENT_ERRORS):
+            raise
+        print(f"Skipping comments of video ID {video_id}: {e}")
+        return None
+    if not comments:
+        return None
+    return FetchedVideo(item=item, stats=video_stats, comments=comments)
+
+
+def build_video_cache(
+    video: FetchedVideo,
+    query: str,
+    title_sentiment: float,
+    comments_sentiments: list[float],
+) -> VideoCache:
+    comment_count = video.stats.commentCount or 0
+    like_count = video.stats.likeCount or 0
+
+    avg_comment_sentiment = sum(comments_sentiments) / len(comments_sentiments)
+    avg_sentiment = (avg_comment_sentiment + title_sentiment) / 2
+    weighted_sentiment = (avg_comment_sentiment * comment_count * 0.988) + (
+        title_sentiment * like_count * 0.012
+    )
+    return VideoCache(
+        video_id=video.item.video_id,
+        query=query,
+        datetime=video.item.published_at,
+        views=video.stats.viewCount or 0,
+        likes=video.stats.likeCount,
+        comments=video.stats.commentCount,
+        avg_comment_sentiment=avg_comment_sentiment,
+        title_sentiment=title_sentiment,
+        avg_sentiment=avg_sentiment,
+        weighted_sentiment=weighted_sentiment,
+    )
+
+
+async def score_videos(
+    videos: list[FetchedVideo], query: str
+) -> Optional[list[VideoCache]]:
+    """None if the ml service failed."""
+    # one ml request for the whole batch: a team per video, the title first
+    teams = [
+        Team(
+            brand=query,
+            title=video.item.title,
+            texts=[video.item.title, *video.comments],
         )
+        for video in videos
+    ]
+    try:
+        sentiment = await get_sentiment_teams(teams)
     except Exception as e:
-        print(f"Error processing video ID {video_id}: {e}")
+        print(f"Error getting sentiment for {len(videos)} videos of {query}: {e}")
         return None
 
+    video_cache = []
+    for video, scores in zip(videos, sentiment):
+        title_sentiment, comments_sentiments = scores[0] or 0.0, scores[1:]
+        if not comments_sentiments:
+            continue
+        video_cache.append(
+            build_video_cache(video, query, title_sentiment, comments_sentiments)
+        )
+    return video_cache
+
 
 async def process_download_interval(
     query: str, start_date: datetime, end_date: datetime
-):
+) -> tuple[list[VideoCache], bool]:
+    """The scored videos and whether none of them failed to download or score."""
     videos = await search_videos_async(
         query, max_results=50, start_date=start_date, end_date=end_date
     )
 
-    video_cache = []
-    tasks = [process_video(item, query) for item in videos.items]
-    for res in await asyncio.gather(*tasks):
-        if res is not None:
-            video_cache.append(res)
+    try:
+        video_stats = await get_video_statistics_async(
+            [item.video_id for item in videos.items]
+        )
+    except Exception as e:
+        print(f"Error getting video statistics for {query}: {e}")
+        return [], False
+
+    tasks = [fetch_video(item, video_stats.get(item.video_id)) for item in videos.items]
+    fetched, complete = [], True
+    for item, res in zip(
+        videos.items, await asyncio.gather(*tasks, return_exceptions=True)
+    ):
+        if isinstance(res, BaseException):
+            print(f"Error processing video ID {item.video_id}: {res}")
+            complete = False
+        elif res is not None:
+            fetched.append(res)
+
+    video_cache = await score_videos(fetched, query)
+    if video_cache is None:
+        return [], False
+    return video_cache, complete
+
+
+def uncovered_gaps(
+    start: datetime, end: datetime, covered: list[tuple[datetime, datetime]]
+) -> list[tuple[datetime, datetime]]:
+    """Parts of [start, end] not in any covered window; covered is sorted by start."""
+    gaps = []
+    current = start
+    for covered_start, covered_end in covered:
+        if covered_start > current:
+            gaps.append((current, min(covered_start, end)))
+        current = max(current, covered_end)
+        if current >= end:
+            break
+    if current < end:
+        gaps.append((current, end))
+    return [
+        (gap_start, gap_end)
+        for gap_start, gap_end in gaps
+        if gap_end - gap_start >= MIN_GAP
+    ]
 
-    return video_cache
+
+async def download_video_data(
+    pool: asyncpg.Pool, query: str, max_results: int, start: datetime, end: datetime
+) -> list[VideoCache]:
+    max_results += 20
+    if max_results > 50:
+        iterations = (max_results // 50) + 1
+        try:
+            intervals = split_date_range(start, end, iterations)
+        except Exception as e:
+            print(f"Error splitting date range: {e}")
+            intervals = [(start, end)]
+    else:
+        intervals = [(start, end)]
+
+    video_data = []
+    complete = True
+    for interval_result in await asyncio.gather(
+        *[
+            process_download_interval(query, start_date, end_date)
+            for start_date, end_date in intervals
+        ]
+    ):
+        interval_videos, interval_complete = interval_result
+        complete = complete and interval_complete
+        video_data.extend(interval_videos)
+    print(f"Inserting {len(video_data)} new video records into the database...")
+    inserted = await insert_video_cache_bulk(pool, video_data)
+    # a window with missing videos is searched again by the next request
+    if complete and inserted:
+        await record_coverage(
+            pool, query, start, end, datetime.now(dt.timezone.utc) - COVERAGE_TTL
+        )
+    return video_data
+
+
+async def fetch_uncovered(
+    pool: asyncpg.Pool, query: str, max_results: int, start: datetime, end: datetime
+) -> list[VideoCache]:
+    """Download the parts of the range that were not searched within the TTL.
+
+    Each gap asks for its share of max_results, so a small gap next to a
+    covered window costs a single search.
+    """
+    start, end = to_db_datetime(start), to_db_datetime(end)
+    covered = await get_coverage(
+        pool, query, start, end, datetime.now(dt.timezone.utc) - COVERAGE_TTL
+    )
+    gaps = uncovered_gaps(start, end, covered)
+    print(f"{len(gaps)} uncovered gaps for {query}")
+
+    window = (end - start).total_seconds()
+    results = await asyncio.gather(
+        *[
+            download_video_data(
+                pool,
+                query,
+                max(
+                    1,
+                    round(max_results * (gap_end - gap_start).total_seconds() / window),
+                ),
+                gap_start,
+                gap_end,
+            )
+            for gap_start, gap_end in gaps
+        ]
+    )
+    return [video for result in results for video in result]
 
 
 async def get_all_video_data(
-    conn: psycopg2, query: str, max_results: int, start: datetime, end: datetime
+    pool: asyncpg.Pool, query: str, max_results: int, start: datetime, end: datetime
 ) -> list[VideoCache]:
-    video_data = search_video_database(conn, query, start, end)
+    await fetch_uncovered(pool, query, max_results, start, end)
+    video_data = await search_video_database(pool, query, start, end)
     print(f"Found {len(video_data)} results")
+    return video_data
 
-    if len(video_data) < max_results:
-        max_results += 20
-        if max_results > 50:
-            iterations = (max_results // 50) + 1
-            try:
-                intervals = split_date_range(start, end, iterations)
-            except Exception as e:
-                print(f"Error splitting date range: {e}")
-                intervals = [(start, end)]
-        else:
-            intervals = [(start, end)]
-
-        video_data = []
-        for interval_result in await asyncio.gather(
-            *[
-                process_download_interval(query, start_date, end_date)
-                for start_date, end_date in intervals
-            ]
-        ):
-            video_data.extend(interval_result)
-            print(f"Inserting {len(video_data)} new video records into the database...")
-        for video in video_data:
-            try:
-                insert_video_cache(conn, video)
-            except Exception as e:
-                pass
-                print(f"Error inserting video cache for video_id {video.video_id}: {e}")
 
-    return video_data
+async def ensure_video_data(
+    pool: asyncpg.Pool, query: str, max_results: int, start: datetime, end: datetime
+):
+    """Like get_all_video_data, but only makes sure the cache is filled, for
+    callers that read the rollup afterwards."""
+    await fetch_uncovered(pool, query, max_results, start, end)
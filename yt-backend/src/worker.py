@@ -0,0 +1,87 @@
+"""Background ingestion of the brands queued in ingestion_jobs.
+
+The chart endpoints only queue a brand and draw whatever is cached, the
+searches and downloads run here. Workers claim jobs with FOR UPDATE SKIP
+LOCKED, so any number of them, in any number of processes, can share the
+queue.
+"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import asyncpg
+
+from charts.latest_histogram import ensure_histogram_data
+from charts.time_series import ensure_time_series_data
+from db import claim_job, enqueue_job, finish_job, release_job, retry_job
+from models import IngestionJob
+
+SOURCE = "youtube"
+# brands ingested at once, their requests share the budget of the rate limiter
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", 4))
+INGEST_POLL_INTERVAL = float(os.environ.get("INGEST_POLL_INTERVAL_SECONDS", 2))
+# a job running for longer than this is assumed to have lost its worker
+INGEST_JOB_TIMEOUT = float(os.environ.get("INGEST_JOB_TIMEOUT_MINUTES", 30)) * 60
+INGEST_MAX_ATTEMPTS = int(os.environ.get("INGEST_MAX_ATTEMPTS", 3))
+# charts queue a brand again once its last ingestion is older than this
+INGEST_FRESHNESS = timedelta(hours=float(os.environ.get("INGEST_FRESHNESS_HOURS", 1)))
+
+
+async def ensure_brand_data(brand: str, pool: asyncpg.Pool, end: datetime):
+    # the recent window goes first, so the time series spans overlapping it
+    # only search what is left of them
+    await ensure_histogram_data(brand, pool, end)
+    await ensure_time_series_data(brand, pool)
+
+
+async def queue_brand(
+    pool: asyncpg.Pool, brand: str, force: bool = False
+) -> Optional[IngestionJob]:
+    fresh_after = datetime.now(timezone.utc)
+    if not force:
+        fresh_after -= INGEST_FRESHNESS
+    return await enqueue_job(pool, SOURCE, brand, fresh_after)
+
+
+async def run_job(pool: asyncpg.Pool, job: IngestionJob):
+    if job.attempts > INGEST_MAX_ATTEMPTS:
+        # claimed again after its worker died on the last attempt
+        await finish_job(pool, job.id, "failed", job.error or "Worker lost")
+        return
+    try:
+        await ensure_brand_data(job.brand, pool, datetime.now())
+    except asyncio.CancelledError:
+        # shutting down, leave the job to the next worker
+        await release_job(pool, job.id)
+        raise
+    except Exception as e:
+        print(f"Error ingesting {job.brand} (attempt {job.attempts}): {e}")
+        if job.attempts < INGEST_MAX_ATTEMPTS:
+            await retry_job(pool, job.id, str(e))
+        else:
+            await finish_job(pool, job.id, "failed", str(e))
+        return
+    await finish_job(pool, job.id, "done")
+
+
+async def run_ingestion_worker(pool: asyncpg.Pool):
+    while True:
+        try:
+            job = await claim_job(pool, SOURCE, INGEST_JOB_TIMEOUT)
+            if job is not None:
+                print(f"Ingesting {job.brand} (job {job.id})")
+                await run_job(pool, job)
+        except Exception as e:
+            # a job left running is claimed again after INGEST_JOB_TIMEOUT
+            print(f"Error in ingestion worker: {e}")
+            job = None
+        if job is None:
+            await asyncio.sleep(INGEST_POLL_INTERVAL)
+
+
+def start_ingestion_workers(pool: asyncpg.Pool) -> list[asyncio.Task]:
+    return [
+        asyncio.create_task(run_ingestion_worker(pool)) for _ in range(INGEST_WORKERS)
+    ]
@@ -1,6 +1,7 @@
 import asyncio
 import os
-import time
+from typing import AsyncIterator
+from urllib.parse import urlparse
 
 import aiohttp
 import dotenv
@@ -8,16 +9,24 @@ import requests
 
 from models import (
     CommentListResponse,
+    CommentPage,
+    CommentRecord,
     CommentThreadRetrieveQuery,
     SearchListResponse,
+    SearchPage,
     SearchQuery,
     VideoListResponse,
+    VideoStatistics,
 )
+from ratelimit import QuotaExceededError, YouTubeRateLimiter
 
 dotenv.load_dotenv()
 
 key = os.getenv("YOUTUBE_KEY")
 
+# validate every response against the full pydantic models (slow, for debugging)
+STRICT_PARSING = os.environ.get("YT_STRICT_PARSING", "false").lower() == "true"
+
 
 # Video search-related functions
 def query_youtube_api(url: str) -> dict:
@@ -33,31 +42,29 @@ def query_youtube_api(url: str) -> dict:
     return resp.json()
 
 
-last_requests: list[float] = []
-queue = []
+rate_limiter = YouTubeRateLimiter()
 
 
-def relax_last():
-    while len(last_requests) > 0 and time.perf_counter() - last_requests[0] > 1:
-        last_requests.pop(0)
+def get_endpoint(url: str) -> str:
+    return urlparse(url).path.rsplit("/", 1)[-1]
 
 
 async def query_youtube_api_async(url: str) -> dict:
-    queue.append(url)
-    relax_last()
-    while len(last_requests) > 100:
-        await asyncio.sleep(0.5)
-        relax_last()
-    url = queue.pop(0)
-    last_requests.append(time.perf_counter())
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers={"Accept": "application/json"}) as resp:
-            if resp.status != 200:
-                print(f"Error response from YouTube API: {resp.status} - {resp.text}")
-                raise ValueError(
-                    f"Request to the api failed. Code {resp.status}. Error: {resp.text}"
-                )
-            return await resp.json()
+    async with rate_limiter.request(get_endpoint(url)):
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url, headers={"Accept": "application/json"}) as resp:
+                if resp.status != 200:
+                    text = await resp.text()
+                    print(f"Error response from YouTube API: {resp.status} - {text}")
+                    if resp.status == 403 and "quotaExceeded" in text:
+                        rate_limiter.quota.exhaust()
+                        raise QuotaExceededError(
+                            f"YouTube quota exhausted. Error: {text}"
+                        )
+                    raise ValueError(
+                        f"Request to the api failed. Code {resp.status}. Error: {text}"
+                    )
+                return await resp.json()
 
 
 def check_key():
@@ -98,10 +105,16 @@ def search_videos(
     )
 
 
+def parse_search_page(response: dict) -> SearchPage:
+    if STRICT_PARSING:
+        SearchListResponse(**response)
+    return SearchPage.from_api(response)
+
+
 async def search_videos_async(
     query, max_results=50, start_date=None, end_date=None
-) -> SearchListResponse:
-    return await execute_search_query_pydantic_async(
+) -> SearchPage:
+    response = await execute_search_query_async(
         SearchQuery(
             q=query,
             max_results=max_results,
@@ -109,6 +122,7 @@ async def search_videos_async(
             published_before=end_date,
         )
     )
+    return parse_search_page(response)
 
 
 # Comment-related functions
@@ -146,19 +160,83 @@ async def get_comments_async(video_id, max_results=50) -> CommentListResponse:
     )
 
 
+# commentThreads returns at most 100 threads per page
+COMMENT_PAGE_SIZE = 100
+
+
+def parse_comment_page(response: dict) -> CommentPage:
+    if STRICT_PARSING:
+        CommentListResponse(**response)
+    return CommentPage.from_api(response)
+
+
+async def iter_comment_pages_async(
+    video_id: str, max_threads: int = 500, include_replies: bool = True
+) -> AsyncIterator[CommentPage]:
+    """Comment thread pages of a video, following nextPageToken up to max_threads."""
+    part = ("snippet", "replies") if include_replies else ("snippet",)
+    page_token = None
+    fetched = 0
+    while fetched < max_threads:
+        response = await execute_comment_query_async(
+            CommentThreadRetrieveQuery(
+                video_id=video_id,
+                part=part,
+                max_results=min(COMMENT_PAGE_SIZE, max_threads - fetched),
+                page_token=page_token,
+            )
+        )
+        page = parse_comment_page(response)
+        yield page
+
+        fetched += len(page.items)
+        page_token = page.next_page_token
+        if page_token is None or not page.items:
+            break
+
+
+async def iter_comments_async(
+    video_id: str, max_comments: int = 500, include_replies: bool = True
+) -> AsyncIterator[CommentRecord]:
+    """Comments of a video page by page, each top level comment followed by
+    its replies, until max_comments comments were yielded.
+
+    The api only embeds a few replies per thread, the rest are not fetched.
+    """
+    count = 0
+    async for page in iter_comment_pages_async(video_id, max_comments, include_replies):
+        for thread in page.items:
+            comments = [thread.comment]
+            if include_replies:
+                comments.extend(thread.replies)
+            for comment in comments:
+                yield comment
+                count += 1
+                if count >= max_comments:
+                    return
+
+
 # Video details-related functions
 
 
-def get_video_query_str(video_id: str) -> str:
+# the videos endpoint accepts at most 50 comma separated ids
+VIDEOS_PER_REQUEST = 50
+
+
+def get_videos_query_str(video_ids: list[str]) -> str:
     query = [
         "https://www.googleapis.com/youtube/v3/videos?",
-        f"id={video_id}&",
+        f"id={','.join(video_ids)}&",
         f"part=statistics&",
         f"key={key}",
     ]
     return "".join(query)
 
 
+def get_video_query_str(video_id: str) -> str:
+    return get_videos_query_str([video_id])
+
+
 def execute_video_query(video_id: str):
     return query_youtube_api(get_video_query_str(video_id))
 
@@ -175,3 +253,26 @@ async def get_video_details_async(video_id: str):
     return VideoListResponse(
         **(await query_youtube_api_async(get_video_query_str(video_id)))
     )
+
+
+async def get_video_statistics_async(
+    video_ids: list[str],
+) -> dict[str, VideoStatistics]:
+    """Statistics for many videos, one request per 50 ids, keyed by video id.
+
+    Videos youtube does not return (e.g. deleted ones) are missing from the dict.
+    """
+    check_key()
+    video_ids = list(dict.fromkeys(video_ids))
+    chunks = [
+        video_ids[i : i + VIDEOS_PER_REQUEST]
+        for i in range(0, len(video_ids), VIDEOS_PER_REQUEST)
+    ]
+    responses = await asyncio.gather(
+        *[query_youtube_api_async(get_videos_query_str(chunk)) for chunk in chunks]
+    )
+    return {
+        video.id: video.statistics
+        for response in responses
+        for video in VideoListResponse(**response).items
+    }